@@ -0,0 +1,120 @@
+"""
+Скорость отправки комментариев в несколько популярных тем: сохранение в запросе и через очередь комментариев
+(core/comment_queue.py). Авторы отправляют форму через тестовый клиент Flask из нескольких потоков. Для очереди
+отдельно показано, сколько комментариев в секунду принято страницей и сколько сохранено в базе данных
+
+Запуск: python -m benchmarks.comments [--posters 8] [--topics 3] [--duration 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+
+def log_in(app, usernames: list, password: str) -> list:
+    """
+    Получить тестовые клиенты, авторизованные под пользователями. Вход выполняется по очереди: одновременных
+    проверок паролей не может быть больше PASSWORD_HASH_MAX_PENDING
+    """
+    clients = []
+
+    for username in usernames:
+        client = app.test_client()
+        if client.post("/login", data={"username": username, "password": password}).status_code != 302:
+            raise RuntimeError(f"Could not log in as {username}")
+
+        clients.append(client)
+
+    return clients
+
+
+def post_comments(clients: list, topic_ids: list, duration: float) -> list:
+    """Отправлять комментарии от имени пользователей, каждый в своём потоке. Возвращает задержки отправки"""
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def poster(seed_value: int, client):
+        rng = random.Random(seed_value)
+        local_latencies = []
+
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            response = client.post(f"/topic/{rng.choice(topic_ids)}", data={
+                "text": "Комментарий для измерения", "submission_key": uuid.uuid4().hex
+            })
+            local_latencies.append(time.perf_counter() - start)
+
+            if response.status_code != 302:
+                raise RuntimeError(f"Posting failed with status {response.status_code}")
+
+        with lock:
+            latencies.extend(local_latencies)
+
+    threads = [threading.Thread(target=poster, args=(i, client)) for i, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posters", type=int, default=8, help="количество одновременных авторов")
+    parser.add_argument("--topics", type=int, default=3, help="количество тем, в которые отправляются комментарии")
+    parser.add_argument("--duration", type=float, default=5, help="длительность отправки в секундах")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/comments.db?check_same_thread=False"
+
+    import main as forum
+    from core import comment_queue
+    from database import session as db_session
+    from database.models import User, Topic, Comment
+    from database.seed import seed, SEED_PASSWORD
+
+    # Страница после отправки не ждёт сохранения комментария, измеряется только приём комментариев
+    app = forum.create_app({"WTF_CSRF_ENABLED": False, "COMMENT_QUEUE_WAIT_SECONDS": 0})
+
+    db_sess = db_session.create_session()
+    seed(db_sess.get_bind(), users=args.posters, categories=5, topics=200, comments=20000, log=lambda _: None)
+    clients = log_in(app, [username for (username,) in db_sess.query(User.username)], SEED_PASSWORD)
+    topic_ids = [i for (i,) in db_sess.query(Topic.id).order_by(Topic.comment_count.desc()).limit(args.topics)]
+    db_session.remove_session()
+
+    def count_comments() -> int:
+        count = db_session.create_session().query(Comment).count()
+        db_session.remove_session()
+        return count
+
+    print(f"{'сохранение':>12} {'принято/с':>10} {'сохранено/с':>12} {'p50, мс':>8} {'p99, мс':>8}")
+
+    for name, queue_enabled in (("в запросе", False), ("очередь", True)):
+        app.config["COMMENT_QUEUE_ENABLED"] = queue_enabled
+        comments_before = count_comments()
+
+        start = time.perf_counter()
+        latencies = post_comments(clients, topic_ids, args.duration)
+        accepted_time = time.perf_counter() - start
+
+        # Ждём, пока очередь сохранит все принятые комментарии
+        while comment_queue.get_queue_stats()["pending"]:
+            time.sleep(0.01)
+        committed_time = time.perf_counter() - start
+
+        saved = count_comments() - comments_before
+        latencies.sort()
+        print(f"{name:>12} {len(latencies) / accepted_time:10.1f} {saved / committed_time:12.1f} "
+              f"{statistics.median(latencies) * 1000:8.1f} {latencies[int(len(latencies) * 0.99)] * 1000:8.1f}")
+
+    comment_queue.stop()
+
+
+if __name__ == "__main__":
+    main()
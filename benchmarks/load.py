@@ -0,0 +1,159 @@
+"""
+Пропускная способность сервера для разработки (Werkzeug) и gunicorn с несколькими процессами под нагрузкой
+неавторизованных читателей: главная страница, категории и страницы тем. База данных - временная SQLite, заполненная
+синтетическими данными, или DATABASE_URL (например, локальный PostgreSQL), если передан --database-url
+
+Запуск: python -m benchmarks.load [--concurrency 16] [--duration 10] [--workers 4] [--threads 4]
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+
+def fill_database(categories: int, topics: int, comments: int) -> tuple:
+    """Заполнить базу данных синтетическими данными. Возвращает (ID категорий, ID тем)"""
+    import main as forum
+    from database import session as db_session
+    from database.models import User, Category, Topic, Comment
+
+    forum.create_app()
+    db_sess = db_session.create_session()
+
+    user = User(username="benchmark", email="benchmark@example.com")
+    user.set_password("benchmark")
+    db_sess.add(user)
+    db_sess.flush()
+
+    rng = random.Random(0)
+    category_list = [Category(title=f"Категория {i}") for i in range(categories)]
+    db_sess.add_all(category_list)
+    db_sess.flush()
+
+    topic_list = []
+    for i in range(topics):
+        category = rng.choice(category_list)
+        topic = Topic(author_id=user.id, category_id=category.id, title=f"Тема номер {i}", text="Текст темы " * 40)
+        topic_list.append(topic)
+        category.topic_count = (category.topic_count or 0) + 1
+    db_sess.add_all(topic_list)
+    db_sess.flush()
+
+    for topic in topic_list:
+        topic.comment_count = comments
+        db_sess.add_all(
+            Comment(author_id=user.id, topic_id=topic.id, text=f"Комментарий {j}\nВторой абзац комментария")
+            for j in range(comments)
+        )
+    db_sess.commit()
+
+    ids = [c.id for c in category_list], [t.id for t in topic_list]
+    db_session.remove_session()
+
+    return ids
+
+
+def wait_for_server(url: str, timeout: float = 30):
+    """Подождать, пока сервер начнёт отвечать"""
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+
+    raise RuntimeError(f"Server at {url} did not start in {timeout} seconds")
+
+
+def generate_load(base_url: str, paths: list, concurrency: int, duration: float) -> tuple:
+    """Отправлять запросы из нескольких потоков. Возвращает (задержки в секундах, количество ошибок)"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        session = requests.Session()
+        local_latencies = []
+        local_errors = 0
+
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            response = session.get(base_url + rng.choice(paths))
+            local_latencies.append(time.perf_counter() - start)
+
+            if response.status_code != 200:
+                local_errors += 1
+
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return latencies, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16, help="количество одновременных клиентов")
+    parser.add_argument("--duration", type=float, default=10, help="длительность нагрузки на сервер в секундах")
+    parser.add_argument("--workers", type=int, default=4, help="количество процессов gunicorn")
+    parser.add_argument("--threads", type=int, default=4, help="количество потоков в процессе gunicorn")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--database-url", help="база данных вместо временной SQLite (должна быть пустой)")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/load.db?check_same_thread=False"
+
+    category_ids, topic_ids = fill_database(categories=10, topics=500, comments=25)
+    paths = ["/"] + [f"/category/{i}" for i in category_ids] + \
+            [f"/topic/{i}" for i in topic_ids] + [f"/topic/{i}?page=2" for i in topic_ids]
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ, WEB_BIND=f"127.0.0.1:{args.port}", WEB_WORKERS=str(args.workers),
+               WEB_THREADS=str(args.threads))
+    servers = {
+        "werkzeug": [sys.executable, "-c", f"import main; main.create_app().run(port={args.port})"],
+        f"gunicorn {args.workers}x{args.threads}": [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                                                    "wsgi:app"],
+    }
+
+    print(f"{'сервер':>16} {'запросов/с':>11} {'p50, мс':>8} {'p99, мс':>8} {'ошибок':>7}")
+
+    for name, command in servers.items():
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        try:
+            wait_for_server(base_url)
+            generate_load(base_url, paths, args.concurrency, 1)  # прогрев
+            latencies, errors = generate_load(base_url, paths, args.concurrency, args.duration)
+        finally:
+            process.terminate()
+            process.wait()
+
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        print(f"{name:>16} {len(latencies) / args.duration:11.1f} {p50:8.1f} {p99:8.1f} {errors:7}")
+
+
+if __name__ == "__main__":
+    main()
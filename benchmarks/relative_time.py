@@ -0,0 +1,63 @@
+"""
+Сравнение скорости вывода даты в человеческом формате: прежняя реализация (морфологический разбор названия месяца
+и два вызова datetime.now() на каждую дату) и текущая (таблица месяцев в родительном падеже и одно текущее время
+на страницу)
+
+Запуск: python -m benchmarks.relative_time
+"""
+import timeit
+from datetime import datetime, timedelta
+
+from core.utilities import get_morph_analyzer, make_agree_with_number, get_created_time, format_created_times, \
+    warm_up_inflections
+
+months = ("январь", "февраль", "март", "апрель", "май", "июнь", "июль", "август", "сентябрь", "октябрь", "ноябрь",
+          "декабрь")
+
+
+def legacy_get_created_time(time: datetime) -> str:
+    """Реализация get_created_time до оптимизации"""
+    morphy = get_morph_analyzer()
+    time_now = datetime.now()
+    passed_time = datetime.now() - time
+
+    if time.year != time_now.year:
+        return f"{time.day} {morphy.parse(months[time.month - 1])[0].inflect({'gent'}).word} {time.year}"
+    elif passed_time.total_seconds() // 86400 >= 2:
+        return f"{time.day} {morphy.parse(months[time.month - 1])[0].inflect({'gent'}).word} в {time.strftime('%H:%M')}"
+    elif passed_time.total_seconds() // 86400 == 1:
+        return f"Вчера в {time.strftime('%H:%M')}"
+    elif passed_time.total_seconds() // 3600 >= 4:
+        return f"Сегодня в {time.strftime('%H:%M')}"
+    elif passed_time.total_seconds() // 3600 != 0:
+        t = int(passed_time.total_seconds() // 3600)
+        return f"{make_agree_with_number(t, 'час', t == 1)} назад".capitalize()
+    elif passed_time.total_seconds() // 60 > 0:
+        t = int(passed_time.total_seconds() // 60)
+        return f"{make_agree_with_number(t, 'минута', t == 1)} назад".capitalize()
+    elif int(passed_time.total_seconds()) != 0:
+        t = int(passed_time.total_seconds())
+        return f"{make_agree_with_number(t, 'секунда', t == 1)} назад".capitalize()
+    else:
+        return "Только что"
+
+
+def main(page_size: int = 10, repeat: int = 2000):
+    warm_up_inflections()
+
+    # Страница с датами разной давности: от нескольких секунд до нескольких лет
+    now = datetime.now()
+    times = [now - timedelta(seconds=7 ** (i % 10)) for i in range(page_size)]
+
+    results = {
+        "прежняя реализация": timeit.timeit(lambda: [legacy_get_created_time(t) for t in times], number=repeat),
+        "get_created_time": timeit.timeit(lambda: [get_created_time(t, now) for t in times], number=repeat),
+        "format_created_times": timeit.timeit(lambda: format_created_times(times, now), number=repeat),
+    }
+
+    for name, seconds in results.items():
+        print(f"{name:>22}: {seconds / (repeat * page_size) * 1e6:8.2f} мкс на дату")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Задержка, количество запросов к базе данных и память на запрос для основных страниц форума. Запросы выполняются
+через тестовый клиент Flask от имени авторизованного пользователя (кэш страниц для неавторизованных не используется).
+База данных - временная SQLite, заполненная database/seed.py, или уже заполненная база из --database-url
+(например, после flask seed)
+
+Результаты можно сохранить (--save) и сравнить с сохранёнными ранее (--compare)
+
+Запуск: python -m benchmarks.routes [--topics 2000] [--comments 100000] [--requests 200] [--save baseline.json]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+
+def get_scenarios(db_sess, rng: random.Random, comments_per_page: int) -> dict:
+    """Получить сценарии: название -> функция, которая по тестовому клиенту выполняет один запрос"""
+    from sqlalchemy import func
+
+    from database.models import Category, Topic, Comment
+
+    topics = db_sess.query(Topic.id, Topic.comment_count).all()
+    category_ids = [i for (i,) in db_sess.query(Category.id)]
+    min_comment, max_comment = db_sess.query(func.min(Comment.id), func.max(Comment.id)).one()
+
+    def topic_page(client):
+        topic_id, comment_count = rng.choice(topics)
+        page = rng.randint(1, max(1, -(-comment_count // comments_per_page)))
+        return client.get(f"/topic/{topic_id}?page={page}")
+
+    def create_topic(client):
+        return client.post("/create_topic", data={
+            "title": f"Тема {rng.random()}", "text": "Текст новой темы для измерения", "category": "None"
+        })
+
+    return {
+        "/": lambda client: client.get("/"),
+        "/topic/<id>?page=N": topic_page,
+        "/comment/<id>": lambda client: client.get(f"/comment/{rng.randint(min_comment, max_comment)}"),
+        "/category/<id>": lambda client: client.get(f"/category/{rng.choice(category_ids)}?page={rng.randint(1, 5)}"),
+        "/create_topic": create_topic,
+    }
+
+
+def measure(client, scenario, requests: int, memory_requests: int) -> dict:
+    """Выполнить запросы сценария и вернуть задержку (p50, p99), запросы к базе данных и пиковую память"""
+    from core.instrumentation import capture_queries
+
+    latencies = []
+    queries = []
+
+    for _ in range(requests):
+        with capture_queries() as captured:
+            start = time.perf_counter()
+            response = scenario(client)
+            response.get_data()
+            latencies.append(time.perf_counter() - start)
+
+        if response.status_code >= 400:
+            raise RuntimeError(f"Request failed with status {response.status_code}")
+
+        queries.append(len(captured))
+
+    # Память измеряется отдельно: tracemalloc замедляет выполнение
+    peaks = []
+    for _ in range(memory_requests):
+        tracemalloc.start()
+        scenario(client).get_data()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "queries": statistics.mean(queries),
+        "peak_kb": statistics.median(peaks) / 1024,
+    }
+
+
+def print_results(results: dict, baseline: dict = None):
+    """Вывести результаты и, если есть, изменение относительно сохранённых результатов"""
+    print(f"{'страница':>20} {'p50, мс':>9} {'p99, мс':>9} {'запросов':>9} {'память, КБ':>11}")
+
+    for name, result in results.items():
+        line = f"{name:>20} {result['p50_ms']:9.2f} {result['p99_ms']:9.2f} {result['queries']:9.1f} " \
+               f"{result['peak_kb']:11.0f}"
+
+        if baseline and name in baseline:
+            old = baseline[name]
+            line += f"   p50 {(result['p50_ms'] / old['p50_ms'] - 1) * 100:+.0f}%, " \
+                    f"p99 {(result['p99_ms'] / old['p99_ms'] - 1) * 100:+.0f}%, " \
+                    f"запросов {result['queries'] - old['queries']:+.1f}, " \
+                    f"память {(result['peak_kb'] / old['peak_kb'] - 1) * 100:+.0f}%"
+
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="уже заполненная база данных вместо временной SQLite")
+    parser.add_argument("--topics", type=int, default=2000, help="количество тем во временной базе данных")
+    parser.add_argument("--comments", type=int, default=100000, help="количество комментариев во временной базе")
+    parser.add_argument("--requests", type=int, default=200, help="количество запросов для каждой страницы")
+    parser.add_argument("--memory-requests", type=int, default=10, help="количество запросов для измерения памяти")
+    parser.add_argument("--save", help="сохранить результаты в JSON-файл")
+    parser.add_argument("--compare", help="сравнить с результатами из JSON-файла")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url or \
+        f"sqlite:///{tempfile.mkdtemp()}/routes.db?check_same_thread=False"
+
+    import main as forum
+    from database import session as db_session
+    from database.models import User
+    from database.seed import seed, SEED_PASSWORD
+
+    app = forum.create_app({"WTF_CSRF_ENABLED": False})
+    db_sess = db_session.create_session()
+
+    if not args.database_url:
+        seed(db_sess.get_bind(), users=200, categories=20, topics=args.topics, comments=args.comments,
+             log=lambda _: None)
+        forum.forum_search.reindex(db_sess)
+        db_sess.commit()
+
+    username = db_sess.query(User.username).filter(User.username.like("user%")).limit(1).scalar()
+    scenarios = get_scenarios(db_sess, random.Random(0), app.config["COMMENTS_PER_PAGE"])
+    db_session.remove_session()
+
+    client = app.test_client()
+    response = client.post("/login", data={"username": username, "password": SEED_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f"Could not log in as {username}")
+
+    results = {}
+    for name, scenario in scenarios.items():
+        measure(client, scenario, 5, 1)  # прогрев
+        results[name] = measure(client, scenario, args.requests, args.memory_requests)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Скорость поиска на синтетическом корпусе: заполнение индекса и задержка запроса (количество результатов и первая
+страница) для индекса FTS5 и индекса в памяти. Тексты генерируются сразу в нормализованном виде, поэтому
+морфологический разбор не учитывается
+
+Запуск: python -m benchmarks.search [--comments 1000000] [--memory-limit 100000]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import sqlalchemy
+
+from core.search import Fts5SearchIndex, MemorySearchIndex, get_document_id, COMMENT
+
+
+def generate_documents(count: int, vocabulary: list, words_per_document: int = 30, seed: int = 0):
+    """Сгенерировать документы-комментарии. Частоты слов распределены по закону Ципфа"""
+    rng = random.Random(seed)
+    cum_weights = []
+    total = 0
+
+    for rank in range(1, len(vocabulary) + 1):
+        total += 1 / rank
+        cum_weights.append(total)
+
+    for i in range(1, count + 1):
+        length = rng.randint(words_per_document // 2, words_per_document * 2)
+        yield get_document_id(COMMENT, i), "", " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=length))
+
+
+def fill_index(index, executor, documents, batch_size: int = 5000) -> float:
+    """Заполнить индекс документами и вернуть время заполнения в секундах"""
+    start = time.perf_counter()
+    batch = []
+
+    for document in documents:
+        batch.append(document)
+
+        if len(batch) == batch_size:
+            index.add_many(executor, batch)
+            batch = []
+
+    index.add_many(executor, batch)
+    return time.perf_counter() - start
+
+
+def measure_queries(index, executor, queries: dict, repeat: int):
+    """Вывести медиану и 99-й перцентиль задержки поиска (количество результатов и первая страница)"""
+    for name, words in queries.items():
+        timings = []
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            found = index.count(executor, words)
+            index.search(executor, words, 0, 10)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings.sort()
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        print(f"    {name:>24}: p50 {statistics.median(timings):8.2f} мс, p99 {p99:8.2f} мс, найдено {found}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--comments", type=int, default=1000000, help="количество комментариев в корпусе")
+    parser.add_argument("--memory-limit", type=int, default=100000,
+                        help="максимальное количество комментариев для индекса в памяти")
+    parser.add_argument("--repeat", type=int, default=50, help="количество повторов каждого запроса")
+    args = parser.parse_args()
+
+    vocabulary = [f"слово{i}" for i in range(50000)]
+    queries = {
+        "частое слово": [vocabulary[0]],
+        "слово средней частоты": [vocabulary[500]],
+        "редкое слово": [vocabulary[40000]],
+        "два частых слова": [vocabulary[0], vocabulary[1]],
+        "частое и редкое слово": [vocabulary[0], vocabulary[20000]],
+    }
+
+    database_path = os.path.join(tempfile.mkdtemp(), "search.db")
+    engine = sqlalchemy.create_engine(f"sqlite:///{database_path}")
+
+    print(f"FTS5, {args.comments} комментариев")
+    with engine.begin() as connection:
+        index = Fts5SearchIndex()
+        index.create(connection)
+        elapsed = fill_index(index, connection, generate_documents(args.comments, vocabulary))
+        print(f"    заполнение индекса: {elapsed:.1f} с")
+        measure_queries(index, connection, queries, args.repeat)
+
+    memory_comments = min(args.comments, args.memory_limit)
+    print(f"Индекс в памяти, {memory_comments} комментариев")
+    index = MemorySearchIndex()
+    elapsed = fill_index(index, None, generate_documents(memory_comments, vocabulary))
+    print(f"    заполнение индекса: {elapsed:.1f} с")
+    measure_queries(index, None, queries, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Время запуска и потребление памяти процессами приложения: импорт main, импорт database.models и запуск миграций
+(alembic, через migrations/env.py). Каждая цель измеряется в отдельном процессе
+
+Запуск: python -m benchmarks.startup
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Код, который выполняется в отдельном процессе для каждой цели
+IMPORT_TEMPLATE = """
+import time
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start)
+"""
+
+TARGETS = {
+    "import main": IMPORT_TEMPLATE.format(code="import main"),
+    "import database.models": IMPORT_TEMPLATE.format(code="import database.models"),
+    "pymorphy2.MorphAnalyzer()": IMPORT_TEMPLATE.format(code="import pymorphy2; pymorphy2.MorphAnalyzer()"),
+}
+
+
+def run(args: list, env: dict) -> tuple:
+    """Запустить процесс и вернуть (время работы в секундах, вывод, максимальный RSS в мегабайтах)"""
+    start = time.perf_counter()
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env)
+    output = process.stdout.read().decode()
+    _, _, rusage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+
+    # На Linux ru_maxrss в килобайтах, на macOS - в байтах
+    rss = rusage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return elapsed, output, rss
+
+
+def main():
+    env = dict(os.environ)
+    database_dir = tempfile.mkdtemp()
+    env["DATABASE_URL"] = f"sqlite:///{database_dir}/startup.db"
+
+    print(f"{'цель':>28} {'импорт, с':>10} {'процесс, с':>11} {'RSS, МБ':>8}")
+
+    for name, code in TARGETS.items():
+        elapsed, output, rss = run([sys.executable, "-c", code], env)
+        print(f"{name:>28} {float(output.strip() or 'nan'):10.3f} {elapsed:11.3f} {rss:8.1f}")
+
+    elapsed, _, rss = run([sys.executable, "-m", "alembic", "current"], env)
+    print(f"{'alembic current':>28} {'-':>10} {elapsed:11.3f} {rss:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
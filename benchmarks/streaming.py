@@ -0,0 +1,100 @@
+"""
+Время до первого байта (TTFB), полное время ответа и пиковое потребление памяти при рендере длинной страницы темы:
+обычный рендер (страница собирается целиком) и потоковый (страница отправляется по частям). Запросы выполняются
+от имени неавторизованного пользователя напрямую через WSGI, кэши страниц и фрагментов сбрасываются перед каждым
+запросом
+
+Запуск: python -m benchmarks.streaming [--comments 200] [--paragraphs 20] [--repeat 20]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from werkzeug.test import EnvironBuilder
+
+
+def fill_database(comments: int, paragraphs: int):
+    """Создать тему с комментариями из нескольких абзацев. Возвращает ID темы"""
+    from database import session as db_session
+    from database.models import User, Topic, Comment
+
+    db_sess = db_session.create_session()
+    user = User(username="benchmark", email="benchmark@example.com")
+    user.set_password("benchmark")
+    db_sess.add(user)
+    db_sess.flush()
+
+    paragraph = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt. " * 4
+    topic = Topic(author_id=user.id, title="Длинная тема", text=paragraph)
+    db_sess.add(topic)
+    db_sess.flush()
+
+    db_sess.add_all(
+        Comment(author_id=user.id, topic_id=topic.id, text="\n".join([paragraph] * paragraphs))
+        for _ in range(comments)
+    )
+    topic.comment_count = comments
+    db_sess.commit()
+
+    topic_id = topic.id
+    db_session.remove_session()
+
+    return topic_id
+
+
+def request(app, path: str) -> tuple:
+    """Выполнить GET-запрос и вернуть (TTFB в мс, полное время в мс, пиковая память в КБ, размер ответа в байтах)"""
+    from core import fragments, http_cache
+
+    fragments.invalidate_all()
+    http_cache.purge_pages()
+
+    environ = EnvironBuilder(path=path).get_environ()
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    chunks = iter(app(environ, lambda status, headers: None))
+    size = len(next(chunks))
+    ttfb = time.perf_counter() - start
+
+    for chunk in chunks:
+        size += len(chunk)
+
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return ttfb * 1000, total * 1000, peak / 1024, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--comments", type=int, default=200, help="количество комментариев на странице темы")
+    parser.add_argument("--paragraphs", type=int, default=20, help="количество абзацев в комментарии")
+    parser.add_argument("--repeat", type=int, default=20, help="количество запросов для каждого режима")
+    args = parser.parse_args()
+
+    database_dir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_dir}/streaming.db?check_same_thread=False"
+
+    import main as forum
+
+    app = forum.create_app({"COMMENTS_PER_PAGE": args.comments})
+    path = f"/topic/{fill_database(args.comments, args.paragraphs)}"
+
+    print(f"{'режим':>10} {'TTFB, мс':>9} {'ответ, мс':>10} {'пик памяти, КБ':>15} {'размер, КБ':>11}")
+
+    for name, stream in (("render", False), ("stream", True)):
+        app.config["STREAM_PAGES"] = stream
+        request(app, path)  # прогрев шаблонов и соединений
+        results = [request(app, path) for _ in range(args.repeat)]
+
+        ttfb, total, peak, size = (statistics.median(column) for column in zip(*results))
+        print(f"{name:>10} {ttfb:9.1f} {total:10.1f} {peak:15.0f} {size / 1024:11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Пропускная способность записи в SQLite при нескольких одновременных авторах комментариев и читателях: без настроек
+(журнал отката, как до database.session.SQLITE_PRAGMAS) и с настройками SQLITE_PRAGMAS (WAL и др.). Каждый автор
+в отдельной транзакции добавляет комментарий и обновляет счётчик темы, читатели в это время читают страницы тем
+
+Запуск: python -m benchmarks.writers [--writers 1 4 16] [--readers 4] [--duration 5]
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import sqlalchemy
+from sqlalchemy import insert, update, select
+from sqlalchemy.exc import OperationalError
+
+from database.models import Topic, Comment
+from database.seed import seed
+from database.session import SqlAlchemyBase, SQLITE_PRAGMAS, set_sqlite_pragmas
+
+
+def create_engine(directory: str, name: str, pragmas: dict):
+    """Создать заполненную базу данных SQLite с указанными настройками соединений"""
+    engine = sqlalchemy.create_engine(
+        f"sqlite:///{directory}/{name}.db", connect_args={"check_same_thread": False},
+        poolclass=sqlalchemy.pool.NullPool
+    )
+    if pragmas:
+        set_sqlite_pragmas(engine, pragmas)
+
+    SqlAlchemyBase.metadata.create_all(engine)
+    seed(engine, users=100, categories=5, topics=200, comments=20000, log=lambda _: None)
+
+    return engine
+
+
+def run_load(engine, writers: int, readers: int, duration: float) -> dict:
+    """Запустить авторов и читателей на duration секунд. Возвращает количество записей, ошибок и задержку записи"""
+    deadline = time.monotonic() + duration
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def writer(seed_value: int):
+        rng = random.Random(seed_value)
+        local_latencies = []
+        local_errors = 0
+
+        while time.monotonic() < deadline:
+            topic_id = rng.randint(1, 200)
+            now = datetime.now()
+            start = time.perf_counter()
+
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(Comment.__table__).values(
+                        author_id=rng.randint(1, 100), topic_id=topic_id, text="Комментарий для измерения",
+                        created_time=now, updated_at=now
+                    ))
+                    connection.execute(update(Topic.__table__).where(Topic.id == topic_id).values(
+                        comment_count=Topic.comment_count + 1, last_comment_at=now, updated_at=now
+                    ))
+                local_latencies.append(time.perf_counter() - start)
+            except OperationalError:
+                # database is locked
+                local_errors += 1
+
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    def reader(seed_value: int):
+        rng = random.Random(seed_value)
+
+        while time.monotonic() < deadline:
+            with engine.connect() as connection:
+                connection.execute(
+                    select(Comment.id, Comment.text).where(Comment.topic_id == rng.randint(1, 200))
+                    .order_by(Comment.created_time).limit(10).offset(rng.randint(0, 50))
+                ).all()
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)] + \
+              [threading.Thread(target=reader, args=(1000 + i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        "commits": len(latencies),
+        "errors": errors[0],
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 4, 16], help="количество авторов")
+    parser.add_argument("--readers", type=int, default=4, help="количество одновременных читателей")
+    parser.add_argument("--duration", type=float, default=5, help="длительность нагрузки в секундах")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    # Без настроек используется только стандартное ожидание блокировки драйвера sqlite3 (5 секунд)
+    engines = {
+        "по умолчанию": create_engine(directory, "default", None),
+        "SQLITE_PRAGMAS": create_engine(directory, "tuned", SQLITE_PRAGMAS),
+    }
+
+    print(f"{'настройки':>15} {'авторов':>8} {'записей/с':>10} {'p50, мс':>8} {'p99, мс':>8} {'ошибок':>7}")
+
+    for writers in args.writers:
+        for name, engine in engines.items():
+            result = run_load(engine, writers, args.readers, args.duration)
+            print(f"{name:>15} {writers:8} {result['commits'] / args.duration:10.1f} {result['p50_ms']:8.1f} "
+                  f"{result['p99_ms']:8.1f} {result['errors']:7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import pickle
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class Cache:
+    def __init__(self, max_size: int = 1024, ttl: float = None):
+        """
+        LRU-кэш в памяти процесса. При переполнении удаляются давно не использованные записи
+
+        :arg max_size: максимальное количество записей
+        :arg ttl: время жизни записи в секундах (None - записи живут до вытеснения или инвалидации)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.__items = OrderedDict()
+        self.__lock = Lock()
+
+    def get(self, key, default=None):
+        """Получить значение по ключу. Если записи нет или она устарела, то будет возвращён default"""
+        with self.__lock:
+            item = self.__items.get(key)
+
+            if item is None:
+                return default
+
+            value, expires = item
+
+            if expires is not None and expires < time.monotonic():
+                del self.__items[key]
+                return default
+
+            self.__items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Записать значение по ключу"""
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+
+        with self.__lock:
+            self.__items[key] = (value, expires)
+            self.__items.move_to_end(key)
+
+            while len(self.__items) > self.max_size:
+                self.__items.popitem(last=False)
+
+    def delete(self, key):
+        """Удалить запись по ключу"""
+        with self.__lock:
+            self.__items.pop(key, None)
+
+    def clear(self):
+        """Удалить все записи"""
+        with self.__lock:
+            self.__items.clear()
+
+    def __len__(self):
+        return len(self.__items)
+
+
+class RedisCache:
+    def __init__(self, url: str, prefix: str, ttl: int = None):
+        """
+        Кэш в Redis, общий для всех процессов приложения. Имеет тот же интерфейс, что и Cache. Для работы нужен
+        пакет redis
+
+        :arg url: адрес сервера Redis (например, redis://localhost:6379/0)
+        :arg prefix: префикс ключей, чтобы разные кэши не пересекались
+        :arg ttl: время жизни записи в секундах (None - записи живут, пока Redis их не вытеснит)
+        """
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("Для общего кэша нужен пакет redis (pip install redis)")
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        value = self.client.get(self.prefix + repr(key))
+        return default if value is None else pickle.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + repr(key), pickle.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + repr(key))
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+
+def create_cache(url: str = None, prefix: str = "", max_size: int = 1024, ttl: float = None):
+    """
+    Создать кэш: в памяти процесса (Cache) или общий в Redis (RedisCache), если указан адрес
+
+    :arg url: адрес сервера Redis или None
+    :arg prefix: префикс ключей в Redis
+    :arg max_size: максимальное количество записей кэша в памяти процесса
+    :arg ttl: время жизни записи в секундах
+    """
+    if url:
+        return RedisCache(url, prefix, None if ttl is None else int(ttl))
+
+    return Cache(max_size, ttl)
@@ -0,0 +1,232 @@
+"""
+Отложенное сохранение комментариев: страница темы проверяет форму и ставит комментарий в очередь, а фоновые потоки
+сохраняют комментарии из очереди частями, по одной транзакции на часть. Комментарии одной темы всегда попадают в одну
+очередь и сохраняются в порядке отправки. Комментарии, которые ещё не сохранены, теряются при аварийном завершении
+процесса (при обычном завершении очередь сохраняется до конца)
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from flask import Flask, current_app
+
+from core import search as forum_search
+from database import session as db_session
+from database.models import Topic, Comment
+
+logger = logging.getLogger(__name__)
+
+QueuedComment = namedtuple("QueuedComment", ["submission_key", "topic_id", "author_id", "text", "created_time"])
+
+__app = None
+__queues = []
+__workers = []
+# Ключи отправки комментариев в очереди -> событие, которое наступает после попытки сохранения
+__pending = {}
+__lock = threading.Lock()
+__stats = {"enqueued": 0, "committed": 0, "duplicates": 0, "skipped": 0, "batches": 0, "failed": 0}
+
+
+def init_comment_queue(app: Flask):
+    """
+    Настроить очередь комментариев по параметрам приложения:
+    COMMENT_QUEUE_ENABLED - сохранять комментарии через очередь,
+    COMMENT_QUEUE_WORKERS - количество потоков, которые сохраняют комментарии (у каждого своя очередь),
+    COMMENT_QUEUE_BATCH_SIZE - сколько комментариев сохраняется в одной транзакции,
+    COMMENT_QUEUE_FLUSH_MS - сколько миллисекунд ждать следующие комментарии для одной транзакции,
+    COMMENT_QUEUE_WAIT_SECONDS - сколько секунд после отправки ждать сохранения комментария, чтобы показать его
+    """
+    global __app
+
+    __app = app
+    app.config.setdefault("COMMENT_QUEUE_ENABLED", False)
+    app.config.setdefault("COMMENT_QUEUE_WORKERS", 1)
+    app.config.setdefault("COMMENT_QUEUE_BATCH_SIZE", 100)
+    app.config.setdefault("COMMENT_QUEUE_FLUSH_MS", 20)
+    app.config.setdefault("COMMENT_QUEUE_WAIT_SECONDS", 2)
+
+
+def is_enabled() -> bool:
+    """Проверить, что комментарии сохраняются через очередь"""
+    return bool(current_app.config["COMMENT_QUEUE_ENABLED"])
+
+
+def __start_workers():
+    """
+    Запустить потоки, которые сохраняют комментарии. Потоки запускаются при первой отправке комментария, то есть уже
+    в процессе-работнике сервера, а не в родительском процессе до fork
+    """
+    for _ in range(__app.config["COMMENT_QUEUE_WORKERS"]):
+        items = queue.Queue()
+        worker = threading.Thread(target=__work, args=(items,), name="comment-queue", daemon=True)
+        __queues.append(items)
+        __workers.append(worker)
+        worker.start()
+
+    atexit.register(stop)
+
+
+def enqueue(submission_key: str, topic_id: int, author_id: int, text: str) -> bool:
+    """
+    Поставить комментарий в очередь. Возвращает False, если комментарий с этим ключом отправки уже в очереди
+
+    :arg submission_key: ключ отправки формы (см. CommentForm.submission_key)
+    :arg topic_id: ID темы
+    :arg author_id: ID автора
+    :arg text: текст комментария
+    """
+    with __lock:
+        if submission_key in __pending:
+            __stats["duplicates"] += 1
+            return False
+
+        if not __workers:
+            __start_workers()
+
+        __pending[submission_key] = threading.Event()
+        __stats["enqueued"] += 1
+
+        # Время отправки и место в очереди получаются под одной блокировкой, чтобы порядок комментариев в очереди
+        # совпадал с порядком их времени
+        __queues[topic_id % len(__queues)].put(
+            QueuedComment(submission_key, topic_id, author_id, text, datetime.now())
+        )
+
+    return True
+
+
+def wait(submission_key: str, timeout: float) -> bool:
+    """Подождать сохранения комментария из очереди. Возвращает False, если комментарий всё ещё в очереди"""
+    event = __pending.get(submission_key)
+    return event is None or event.wait(timeout)
+
+
+def __work(items: queue.Queue):
+    """Собирать комментарии из очереди в части и сохранять их, пока в очередь не придёт None"""
+    batch_size = __app.config["COMMENT_QUEUE_BATCH_SIZE"]
+    flush_interval = __app.config["COMMENT_QUEUE_FLUSH_MS"] / 1000
+    stopped = False
+
+    while not stopped:
+        item = items.get()
+        if item is None:
+            break
+
+        batch = [item]
+        deadline = time.monotonic() + flush_interval
+
+        while len(batch) < batch_size:
+            try:
+                item = items.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+
+            if item is None:
+                stopped = True
+                break
+
+            batch.append(item)
+
+        with __app.app_context():
+            __commit_batch(batch)
+
+
+def __commit_batch(batch: list):
+    """Сохранить часть комментариев. Если транзакция не удалась, то комментарии сохраняются по одному"""
+    try:
+        __save(batch)
+        committed = batch
+    except Exception:
+        logger.exception("Could not save %d queued comments in one transaction", len(batch))
+        committed = []
+
+        for item in batch:
+            try:
+                __save([item])
+                committed.append(item)
+            except Exception:
+                logger.exception("Could not save queued comment %s", item.submission_key)
+
+    with __lock:
+        __stats["batches"] += 1
+        __stats["failed"] += len(batch) - len(committed)
+
+        for item in batch:
+            __pending.pop(item.submission_key).set()
+
+
+def __save(batch: list):
+    """Сохранить комментарии в одной транзакции, пропуская уже сохранённые ключи отправки"""
+    db_sess = db_session.create_session()
+
+    try:
+        keys = [item.submission_key for item in batch]
+        saved_keys = {
+            key for (key,) in db_sess.query(Comment.submission_key).filter(Comment.submission_key.in_(keys))
+        }
+        topics = {
+            topic.id: topic
+            for topic in db_sess.query(Topic).filter(Topic.id.in_({item.topic_id for item in batch}))
+        }
+        duplicates = skipped = 0
+
+        for item in batch:
+            topic = topics.get(item.topic_id)
+
+            if item.submission_key in saved_keys:
+                duplicates += 1
+                continue
+            elif topic is None:
+                # Тема удалена, пока комментарий был в очереди
+                skipped += 1
+                continue
+
+            comment = Comment(
+                author_id=item.author_id,
+                topic_id=item.topic_id,
+                text=item.text,
+                created_time=item.created_time,
+                submission_key=item.submission_key
+            )
+            db_sess.add(comment)
+            db_sess.flush()
+            topic.on_comment_added(comment)
+            forum_search.index_comment(db_sess, comment)
+            saved_keys.add(item.submission_key)
+
+        db_sess.commit()
+    except Exception:
+        db_sess.rollback()
+        raise
+    finally:
+        db_session.remove_session()
+
+    with __lock:
+        __stats["committed"] += len(batch) - duplicates - skipped
+        __stats["duplicates"] += duplicates
+        __stats["skipped"] += skipped
+
+
+def stop(timeout: float = 10):
+    """Сохранить оставшиеся комментарии и остановить потоки. Вызывается при завершении процесса"""
+    for items in __queues:
+        items.put(None)
+
+    for worker in __workers:
+        worker.join(timeout)
+
+    __queues.clear()
+    __workers.clear()
+
+
+def get_queue_stats() -> dict:
+    """
+    Получить статистику очереди: количество комментариев в очереди, сохранённых, повторных, пропущенных (тема удалена)
+    и несохранённых из-за ошибок
+    """
+    with __lock:
+        return {"pending": len(__pending), **__stats}
@@ -1,5 +1,7 @@
+from uuid import uuid4
+
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, TextAreaField, SelectField, BooleanField
+from wtforms import StringField, PasswordField, SubmitField, TextAreaField, SelectField, BooleanField, HiddenField
 from wtforms.fields.html5 import EmailField
 from wtforms.validators import DataRequired as DataRequiredWtf, ValidationError, EqualTo, Length
 
@@ -79,6 +81,9 @@ class CommentForm(FlaskForm):
         "Текст",
         validators=[DataRequired(), Length(-1, 2048, "Текст не должен превышать более 2048 символов")]
     )
+    # Ключ, который создаётся при показе формы. Повторная отправка той же формы (например, двойное нажатие кнопки)
+    # приходит с тем же ключом и не создаёт второй комментарий
+    submission_key = HiddenField(default=lambda: uuid4().hex, validators=[Length(-1, 32)])
     submit = SubmitField("Отправить")
 
 
@@ -0,0 +1,106 @@
+from flask import Flask, render_template
+from flask_login import current_user
+from markupsafe import Markup
+
+from core.cache import create_cache
+from core.utilities import make_agree_with_number
+from database.models import Topic, Comment
+
+# Кэш готового HTML превью тем и комментариев. Ключ - (вид фрагмента, ID объекта, роль зрителя), значение -
+# (отметка версии объекта, HTML). Если отметка изменилась, то фрагмент рендерится заново. Отметка включает логин
+# автора: после его изменения фрагменты рендерятся заново во всех процессах приложения, а не только в том, где
+# был сброшен кэш
+fragment_cache = create_cache(max_size=4096)
+# Роли зрителя, от которых зависит HTML фрагмента
+ROLES = ("reader", "editor")
+
+
+def init_fragment_cache(app: Flask):
+    """
+    Подключить кэш фрагментов к приложению. Если задан FRAGMENT_CACHE_URL, то используется общий кэш в Redis,
+    иначе кэш в памяти процесса размером FRAGMENT_CACHE_SIZE
+    """
+    global fragment_cache
+
+    fragment_cache = create_cache(
+        app.config.get("FRAGMENT_CACHE_URL"), "fragment:", app.config.get("FRAGMENT_CACHE_SIZE", 4096)
+    )
+    app.jinja_env.globals.update(render_topic_preview=render_topic_preview, render_comment=render_comment)
+
+
+def render_fragment(template_name: str, key: tuple, stamp: tuple, **context) -> Markup:
+    """
+    Получить HTML фрагмента из кэша или отрендерить его
+
+    :arg template_name: шаблон фрагмента
+    :arg key: ключ фрагмента (вид фрагмента, ID объекта, роль зрителя)
+    :arg stamp: отметка версии объекта (время изменения и всё, от чего ещё зависит HTML)
+    :arg context: параметры шаблона
+    """
+    cached = fragment_cache.get(key)
+
+    if cached is not None and cached[0] == stamp:
+        return Markup(cached[1])
+
+    html = render_template(template_name, make_agree_with_number=make_agree_with_number, **context)
+    fragment_cache.set(key, (stamp, html))
+
+    return Markup(html)
+
+
+def get_author_username(comment_or_topic) -> str:
+    """Получить логин автора темы или комментария (None, если автора нет)"""
+    return comment_or_topic.author.username if comment_or_topic.author else None
+
+
+def render_topic_preview(topic: Topic) -> Markup:
+    """Превью темы для главной страницы, категорий и поиска"""
+    created_time = topic.get_created_time()
+
+    return render_fragment(
+        "tools/topic_preview.html", ("topic_preview", topic.id, "reader"),
+        (topic.updated_at, created_time, get_author_username(topic)),
+        topic=topic, created_time=created_time
+    )
+
+
+def render_comment(comment_or_topic, topic: Topic) -> Markup:
+    """
+    Комментарий (или описание темы) на странице темы
+
+    :arg comment_or_topic: комментарий или тема
+    :arg topic: тема, к которой относится комментарий
+    """
+    is_comment = isinstance(comment_or_topic, Comment)
+    can_edit = is_comment and current_user.is_authenticated and (
+        (current_user.id == comment_or_topic.author_id and not topic.is_locked) or current_user.is_admin()
+    )
+    created_time = comment_or_topic.get_created_time()
+
+    return render_fragment(
+        "tools/comment.html",
+        ("comment" if is_comment else "topic", comment_or_topic.id, ROLES[can_edit]),
+        (comment_or_topic.updated_at, created_time, get_author_username(comment_or_topic)),
+        comment_or_topic=comment_or_topic, is_comment=is_comment, can_edit=can_edit, created_time=created_time
+    )
+
+
+def invalidate_topic(topic_id: int):
+    """Удалить из кэша фрагменты темы"""
+    for role in ROLES:
+        fragment_cache.delete(("topic_preview", topic_id, role))
+        fragment_cache.delete(("topic", topic_id, role))
+
+
+def invalidate_comment(comment_id: int):
+    """Удалить из кэша фрагменты комментария"""
+    for role in ROLES:
+        fragment_cache.delete(("comment", comment_id, role))
+
+
+def invalidate_all():
+    """
+    Удалить из кэша все фрагменты (например, после изменения логина пользователя). В кэше в памяти очищается только
+    кэш текущего процесса, остальные процессы узнают об изменении по отметке версии
+    """
+    fragment_cache.clear()
@@ -0,0 +1,105 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Flask, request, current_app, make_response
+from flask_login import current_user
+
+from core.cache import create_cache
+from database.models import Topic, Category, Comment, User
+from database.session import on_change, create_session
+
+# Готовые страницы для неавторизованных пользователей. Ключ - путь с параметрами, значение - (ETag, ответ)
+page_cache = create_cache(max_size=1024)
+
+
+def init_http_cache(app: Flask):
+    """
+    Подключить кэширование страниц. HTTP_CACHE_TTL - сколько секунд страница считается свежей (относительные
+    даты на странице, например "5 минут назад", обновляются не реже этого интервала)
+    """
+    global page_cache
+
+    app.config.setdefault("HTTP_CACHE_TTL", 60)
+    page_cache = create_cache(max_size=app.config.get("PAGE_CACHE_SIZE", 1024), ttl=app.config["HTTP_CACHE_TTL"])
+
+
+@on_change(Topic, Category, Comment, User)
+def purge_pages():
+    """Удалить все готовые страницы из кэша"""
+    page_cache.clear()
+
+
+def cache_stream(key: str, etag: str, content_type: str, chunks):
+    """Отправлять потоковый ответ и одновременно собирать его, чтобы положить готовую страницу в кэш"""
+    body = []
+
+    for chunk in chunks:
+        body.append(chunk)
+        yield chunk
+
+    # Если клиент отключился раньше, то генератор закрыт на yield, и неполная страница в кэш не попадает
+    page_cache.set(key, (etag, content_type, b"".join(body)))
+
+
+def conditional_page(get_stamp):
+    """
+    Декоратор для страницы, доступной для чтения без авторизации. Для неавторизованных пользователей страница
+    получает ETag и Last-Modified по отметке изменения данных, на повторный запрос с тем же ETag отдаётся 304 без
+    рендера, а готовая страница хранится в кэше
+
+    :arg get_stamp: функция, которая получает сессию базы данных и параметры страницы и возвращает отметку
+    изменения показываемых данных - кортеж, первый элемент которого время последнего изменения, или None, если
+    страницу кэшировать нельзя (например, объекта нет)
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET" or current_user.is_authenticated:
+                return func(*args, **kwargs)
+
+            stamp = get_stamp(create_session(), *args, **kwargs)
+
+            if stamp is None:
+                return func(*args, **kwargs)
+
+            # Страница считается изменившейся и по истечении HTTP_CACHE_TTL, так как на ней есть относительные даты
+            ttl = current_app.config["HTTP_CACHE_TTL"]
+            period_start = datetime.fromtimestamp(time.time() // ttl * ttl)
+            last_modified = max(stamp[0] or period_start, period_start).astimezone(timezone.utc).replace(
+                tzinfo=None, microsecond=0
+            )
+            etag = hashlib.sha1(f"{request.full_path}|{stamp!r}|{period_start.isoformat()}".encode()).hexdigest()
+
+            if etag in request.if_none_match or not request.if_none_match and request.if_modified_since and \
+                    last_modified <= request.if_modified_since:
+                response = current_app.response_class(status=304)
+            else:
+                cached = page_cache.get(request.full_path)
+
+                if cached is not None and cached[0] == etag:
+                    response = current_app.response_class(cached[2], content_type=cached[1])
+                else:
+                    response = make_response(func(*args, **kwargs))
+
+                    if response.status_code != 200:
+                        return response
+
+                    if response.is_streamed:
+                        response.response = cache_stream(
+                            request.full_path, etag, response.content_type, response.iter_encoded()
+                        )
+                    else:
+                        page_cache.set(request.full_path, (etag, response.content_type, response.get_data()))
+
+            response.set_etag(etag)
+            response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+            # Браузер может хранить страницу, но должен проверять её актуальность при каждом запросе
+            response.cache_control.no_cache = True
+
+            return response
+
+        return wrapper
+
+    return decorator
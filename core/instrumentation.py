@@ -0,0 +1,384 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Flask, g, has_request_context, current_app, request, Response, stream_with_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Метрики процесса для /metrics: (название, метки) -> значение. В каждом процессе сервера свои метрики
+__metrics = {}
+__metrics_lock = threading.Lock()
+# Границы корзин гистограмм времени в секундах и гистограммы, которые есть в метриках
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+HISTOGRAMS = {"forum_request_duration_seconds", "forum_password_hash_duration_seconds"}
+
+# Семплирующий профилировщик: ID потока обрабатываемого запроса -> количество одинаковых стеков вызовов
+__samples = {}
+__samples_lock = threading.Lock()
+__sampler = None  # (ID процесса, поток профилировщика)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Страница сделала больше запросов к базе данных, чем для неё заявлено"""
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get("query_count", 0) + 1
+
+    if context is not None:
+        context.query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _time_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and context is not None and hasattr(context, "query_start"):
+        add_timing("db", time.perf_counter() - context.query_start)
+
+
+def get_query_count() -> int:
+    """Получить количество запросов к базе данных, сделанных во время текущего запроса"""
+    return g.get("query_count", 0)
+
+
+def add_timing(name: str, seconds: float):
+    """
+    Добавить время к этапу обработки текущего запроса (например, db или render)
+
+    :arg name: название этапа
+    :arg seconds: время в секундах
+    """
+    if has_request_context():
+        timings = g.setdefault("timings", {})
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed(name: str):
+    """Контекстный менеджер, который добавляет время выполнения блока к этапу обработки запроса (см. add_timing)"""
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        add_timing(name, time.perf_counter() - start)
+
+
+def count_call(name: str):
+    """
+    Посчитать вызов дорогой функции (например, морфологического разбора pymorphy2) в текущем запросе и в метриках
+
+    :arg name: название функции
+    """
+    if has_request_context():
+        calls = g.setdefault("calls", {})
+        calls[name] = calls.get(name, 0) + 1
+
+    add_metric("forum_calls_total", {"name": name})
+
+
+def add_metric(name: str, labels: dict, value: float = 1):
+    """
+    Увеличить метрику процесса
+
+    :arg name: название метрики
+    :arg labels: метки метрики
+    :arg value: на сколько увеличить метрику
+    """
+    key = (name, tuple(sorted((label, str(label_value)) for label, label_value in labels.items())))
+
+    with __metrics_lock:
+        __metrics[key] = __metrics.get(key, 0) + value
+
+
+def add_duration(name: str, labels: dict, duration: float):
+    """
+    Добавить время в гистограмму: ряды _sum, _count и _bucket по DURATION_BUCKETS. Название должно быть в HISTOGRAMS
+
+    :arg name: название гистограммы
+    :arg labels: метки метрики
+    :arg duration: время в секундах
+    """
+    add_metric(f"{name}_sum", labels, duration)
+    add_metric(f"{name}_count", labels)
+
+    for bucket in DURATION_BUCKETS + (float("inf"),):
+        if duration <= bucket:
+            add_metric(f"{name}_bucket", {**labels, "le": "+Inf" if bucket == float("inf") else f"{bucket:g}"})
+
+
+def format_labels(labels) -> str:
+    """Метки метрики в формате Prometheus"""
+    if not labels:
+        return ""
+
+    escaped = [(key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for key, value in labels]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def get_metrics_text() -> str:
+    """Получить метрики процесса в текстовом формате Prometheus"""
+    with __metrics_lock:
+        metrics = sorted(__metrics.items())
+
+    lines = []
+    last_name = None
+
+    for (name, labels), value in metrics:
+        # Для гистограммы тип указывается один раз для всех рядов _bucket, _sum и _count
+        base_name = re.sub(r"_(bucket|sum|count)$", "", name)
+        if base_name not in HISTOGRAMS:
+            base_name = name
+
+        if base_name != last_name:
+            metric_type = "histogram" if base_name in HISTOGRAMS else "counter"
+            lines.append(f"# TYPE {base_name} {metric_type}")
+            last_name = base_name
+
+        lines.append(f"{name}{format_labels(labels)} {value:g}")
+
+    return "\n".join(lines) + "\n"
+
+
+def record_request(endpoint: str, status: int, duration: float):
+    """Записать в метрики обработанный запрос: количество, время, запросы к базе данных и время рендера"""
+    timings = g.get("timings", {})
+
+    add_metric("forum_requests_total", {"endpoint": endpoint, "method": request.method, "status": status})
+    add_duration("forum_request_duration_seconds", {"endpoint": endpoint}, duration)
+
+    add_metric("forum_sql_queries_total", {"endpoint": endpoint}, get_query_count())
+    add_metric("forum_sql_duration_seconds_total", {"endpoint": endpoint}, timings.get("db", 0.0))
+    add_metric("forum_render_duration_seconds_total", {"endpoint": endpoint}, timings.get("render", 0.0))
+
+
+def recorded_stream(chunks, status: int):
+    """Отдавать части потокового ответа и записать запрос в метрики, когда ответ отправлен или прерван"""
+    try:
+        yield from chunks
+    finally:
+        record_request(request.endpoint or "unknown", status, time.perf_counter() - g.request_start)
+
+
+def get_server_timing(duration: float) -> str:
+    """Значение заголовка Server-Timing для текущего запроса"""
+    timings = g.get("timings", {})
+    parts = [
+        f"app;dur={duration * 1000:.1f}",
+        f'db;dur={timings.get("db", 0.0) * 1000:.1f};desc="{get_query_count()} queries"',
+        f"render;dur={timings.get('render', 0.0) * 1000:.1f}",
+    ]
+    parts += [f'{name};desc="{count} calls"' for name, count in g.get("calls", {}).items()]
+
+    return ", ".join(parts)
+
+
+def get_folded_stack(frame) -> str:
+    """Стек вызовов в формате flamegraph (от внешнего вызова к внутреннему через точку с запятой)"""
+    stack = []
+
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+
+    return ";".join(reversed(stack))
+
+
+def sample_stacks(interval: float):
+    """Раз в interval секунд запоминать стеки вызовов потоков, обрабатывающих запросы"""
+    while True:
+        time.sleep(interval)
+        frames = sys._current_frames()
+
+        with __samples_lock:
+            for thread_id, samples in __samples.items():
+                frame = frames.get(thread_id)
+
+                if frame is not None:
+                    samples[get_folded_stack(frame)] += 1
+
+
+def start_profiling(interval: float):
+    """Начать семплировать стеки текущего потока (при первом вызове в процессе запускается поток профилировщика)"""
+    global __sampler
+
+    with __samples_lock:
+        # После fork поток профилировщика родительского процесса не работает
+        if __sampler is None or __sampler[0] != os.getpid():
+            thread = threading.Thread(target=sample_stacks, args=(interval,), name="profiler", daemon=True)
+            thread.start()
+            __sampler = (os.getpid(), thread)
+
+        __samples[threading.get_ident()] = Counter()
+
+
+def stop_profiling() -> Counter:
+    """Закончить семплирование стеков текущего потока и получить собранные стеки"""
+    with __samples_lock:
+        return __samples.pop(threading.get_ident(), Counter())
+
+
+def dump_profile(directory: str, endpoint: str, duration: float, samples: Counter) -> str:
+    """
+    Сохранить стеки медленного запроса в файл в формате flamegraph (стек и количество через пробел на строке).
+    Возвращает путь к файлу
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(
+        directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{int(duration * 1000)}ms-{os.getpid()}.folded"
+    )
+
+    with open(path, "w", encoding="utf-8") as file:
+        for stack, count in samples.most_common():
+            file.write(f"{stack} {count}\n")
+
+    return path
+
+
+def query_budget(limit: int):
+    """
+    Декоратор для обработчика страницы, ограничивающий количество запросов к базе данных (включая запросы во время
+    рендера шаблона). При превышении в режиме тестирования (app.testing или QUERY_BUDGET_STRICT) выбрасывается
+    QueryBudgetExceeded, в остальных случаях пишется предупреждение в лог. Для потокового ответа запросы считаются
+    после того, как он отправлен целиком
+
+    :arg limit: максимальное количество запросов к базе данных
+    """
+    def decorator(func):
+        def check():
+            count = get_query_count()
+
+            if count > limit:
+                message = f"{request.method} {request.path}: {count} queries to the database, budget is {limit}"
+
+                if current_app.testing or current_app.config.get("QUERY_BUDGET_STRICT"):
+                    raise QueryBudgetExceeded(message)
+
+                logger.warning(message)
+
+        def checked_stream(chunks):
+            yield from chunks
+            check()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            result = func(*args, **kwargs)
+
+            if isinstance(result, Response) and result.is_streamed:
+                result.response = stream_with_context(checked_stream(result.response))
+            else:
+                check()
+
+            return result
+
+        wrapper.query_budget = limit
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def capture_queries():
+    """Контекстный менеджер, который собирает выполненные внутри него SQL-запросы в список (запрос, параметры)"""
+    queries = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        queries.append((statement, parameters))
+
+    event.listen(Engine, "before_cursor_execute", listener)
+
+    try:
+        yield queries
+    finally:
+        event.remove(Engine, "before_cursor_execute", listener)
+
+
+def find_full_scans(connection, statement: str, parameters, tables) -> list:
+    """
+    Найти полные просмотры таблиц (без индекса) в плане запроса SQLite (EXPLAIN QUERY PLAN)
+
+    :arg connection: DBAPI-соединение с базой данных SQLite
+    :arg statement: SQL-запрос
+    :arg parameters: параметры запроса
+    :arg tables: названия таблиц, для которых полный просмотр считается ошибкой
+    """
+    plan = connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    full_scans = []
+
+    for row in plan:
+        detail = row[-1]
+        match = re.match(r"SCAN (\w+)", detail)
+
+        # Псевдонимы таблиц из joinedload имеют вид users_1
+        if match and "INDEX" not in detail and re.sub(r"_\d+$", "", match.group(1)) in tables:
+            full_scans.append(detail)
+
+    return full_scans
+
+
+def init_instrumentation(app: Flask):
+    """
+    Подключить инструменты для измерения работы приложения. Количество запросов к базе данных считается всегда,
+    остальное включается параметрами приложения:
+    METRICS_ENABLED - заголовок Server-Timing (время обработки, запросов к базе данных, рендера и вызовы pymorphy2;
+    для потоковых страниц - только до начала отправки) и страница /metrics с метриками в формате Prometheus,
+    PROFILE_SLOW_REQUEST_MS - семплировать стеки вызовов и сохранять их для запросов дольше этого времени
+    в PROFILE_DIR (формат flamegraph), PROFILE_INTERVAL_MS - интервал семплирования
+    """
+    metrics_enabled = app.config.get("METRICS_ENABLED")
+    slow_request = app.config.get("PROFILE_SLOW_REQUEST_MS")
+    profile_dir = app.config.get("PROFILE_DIR") or "profiles"
+    profile_interval = (app.config.get("PROFILE_INTERVAL_MS") or 5) / 1000
+
+    @app.before_request
+    def reset_query_count():
+        g.query_count = 0
+        g.request_start = time.perf_counter()
+
+        if slow_request:
+            start_profiling(profile_interval)
+
+    @app.after_request
+    def add_server_timing(response):
+        if metrics_enabled and request.endpoint != "metrics":
+            # Заголовок отправляется до тела ответа, поэтому для потокового ответа (STREAM_PAGES) он учитывает только
+            # работу до начала отправки. Запросы к базе данных и рендер во время отправки попадают только в метрики,
+            # которые для такого ответа записываются после отправки целиком
+            response.headers["Server-Timing"] = get_server_timing(time.perf_counter() - g.request_start)
+
+            if response.is_streamed:
+                response.response = stream_with_context(recorded_stream(response.response, response.status_code))
+            else:
+                record_request(request.endpoint or "unknown", response.status_code,
+                               time.perf_counter() - g.request_start)
+
+        return response
+
+    @app.teardown_request
+    def save_slow_profile(exception=None):
+        if not slow_request:
+            return
+
+        samples = stop_profiling()
+        duration = time.perf_counter() - g.get("request_start", time.perf_counter())
+
+        if duration * 1000 >= slow_request and samples:
+            path = dump_profile(profile_dir, request.endpoint or "unknown", duration, samples)
+            logger.info("%s %s took %.0f ms, profile saved to %s", request.method, request.path, duration * 1000, path)
+
+    if metrics_enabled:
+        @app.route("/metrics")
+        def metrics():
+            """Метрики процесса в формате Prometheus"""
+            return Response(get_metrics_text(), mimetype="text/plain; version=0.0.4")
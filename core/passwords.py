@@ -0,0 +1,106 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+
+from flask import Flask
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from core.instrumentation import add_metric, add_duration
+
+# Политика хеширования паролей: алгоритм и количество итераций (см. werkzeug.security.generate_password_hash)
+__algorithm = "pbkdf2:sha256"
+__iterations = 150000
+# Хеширование выполняется в отдельном пуле потоков. Хеширования одновременно ждут не больше запросов, чем мест
+# в __slots, остальные ждут место не дольше __wait_timeout секунд и получают ответ 503, не занимая потоки сервера
+__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="password-hash")
+__slots = BoundedSemaphore(2)
+__wait_timeout = 0.5
+# Статистика хеширования для /pool_status: количество, суммарное и наибольшее время в секундах, отклонённые
+# запросы. Время каждого хеширования и отклонённые запросы также попадают в метрики на /metrics
+__stats = {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0, "rejected": 0}
+__stats_lock = Lock()
+
+
+class PasswordHashingBusy(ServiceUnavailable):
+    """Слишком много одновременных проверок паролей (например, при переборе паролей)"""
+    description = "Сервер занят, попробуйте войти позже"
+
+
+def init_password_hashing(app: Flask):
+    """
+    Настроить хеширование паролей по параметрам приложения:
+    PASSWORD_HASH_ALGORITHM - алгоритм (например, pbkdf2:sha256 или pbkdf2:sha512),
+    PASSWORD_HASH_ITERATIONS - количество итераций,
+    PASSWORD_HASH_THREADS - количество потоков для хеширования,
+    PASSWORD_HASH_MAX_PENDING - сколько запросов одновременно могут ждать хеширования,
+    PASSWORD_HASH_WAIT_TIMEOUT - сколько секунд ждать места в очереди
+    """
+    global __algorithm, __iterations, __executor, __slots, __wait_timeout
+
+    __algorithm = app.config.get("PASSWORD_HASH_ALGORITHM") or __algorithm
+    __iterations = app.config.get("PASSWORD_HASH_ITERATIONS") or __iterations
+    __executor = ThreadPoolExecutor(
+        max_workers=app.config.get("PASSWORD_HASH_THREADS") or 1, thread_name_prefix="password-hash"
+    )
+    __slots = BoundedSemaphore(app.config.get("PASSWORD_HASH_MAX_PENDING") or 2)
+    __wait_timeout = app.config.get("PASSWORD_HASH_WAIT_TIMEOUT") or __wait_timeout
+
+
+def get_hash_method() -> str:
+    """Получить метод хеширования по текущей политике в формате werkzeug (например, pbkdf2:sha256:150000)"""
+    return f"{__algorithm}:{__iterations}"
+
+
+def __run_limited(func, *args):
+    """Выполнить хеширование в пуле потоков с ограничением количества одновременных запросов"""
+    if not __slots.acquire(timeout=__wait_timeout):
+        with __stats_lock:
+            __stats["rejected"] += 1
+
+        add_metric("forum_password_hash_rejected_total", {})
+        raise PasswordHashingBusy()
+
+    try:
+        start = time.perf_counter()
+        result = __executor.submit(func, *args).result()
+        elapsed = time.perf_counter() - start
+    finally:
+        __slots.release()
+
+    with __stats_lock:
+        __stats["count"] += 1
+        __stats["total_seconds"] += elapsed
+        __stats["max_seconds"] = max(__stats["max_seconds"], elapsed)
+
+    add_duration("forum_password_hash_duration_seconds", {}, elapsed)
+
+    return result
+
+
+def hash_password(password: str) -> str:
+    """Получить хеш пароля по текущей политике"""
+    return __run_limited(generate_password_hash, password, get_hash_method())
+
+
+def verify_password(hashed_password: str, password: str) -> bool:
+    """Проверить пароль по хешу"""
+    return __run_limited(check_password_hash, hashed_password, password)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Проверить, что хеш создан не по текущей политике (другой алгоритм или количество итераций)"""
+    return hashed_password.split("$", 1)[0] != get_hash_method()
+
+
+def get_hash_stats() -> dict:
+    """Получить статистику хеширования паролей: количество, среднее и наибольшее время в миллисекундах"""
+    with __stats_lock:
+        stats = dict(__stats)
+
+    return {
+        "count": stats["count"],
+        "avg_ms": stats["total_seconds"] / stats["count"] * 1000 if stats["count"] else 0.0,
+        "max_ms": stats["max_seconds"] * 1000,
+        "rejected": stats["rejected"],
+    }
@@ -0,0 +1,45 @@
+import time
+from functools import wraps
+
+from flask import Flask, request, session, current_app
+
+from database.session import use_read_pool, has_writes
+
+
+def init_read_routing(app: Flask):
+    """
+    Настроить чтение через реплики. DATABASE_STICKY_SECONDS - сколько секунд после запроса, изменившего базу данных,
+    пользователь читает только основную базу данных: реплики отстают от неё, и пользователь не увидел бы, например,
+    только что оставленный комментарий
+    """
+    app.config.setdefault("DATABASE_STICKY_SECONDS", 10)
+
+    @app.after_request
+    def stick_after_writes(response):
+        if has_writes():
+            stick_to_primary()
+
+        return response
+
+
+def stick_to_primary():
+    """
+    Читать основную базу данных следующие DATABASE_STICKY_SECONDS секунд. Вызывается автоматически после запроса,
+    изменившего базу данных, и вручную, если изменение будет сохранено позже (см. core/comment_queue.py)
+    """
+    session["read_primary_until"] = time.time() + current_app.config["DATABASE_STICKY_SECONDS"]
+
+
+def read_only_view(func):
+    """
+    Декоратор для страницы, которая при GET-запросе только читает базу данных: такие запросы читают через реплики или
+    пул соединений для чтения (см. database.session.use_read_pool), если пользователь недавно не изменял базу данных
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if request.method in ("GET", "HEAD") and session.get("read_primary_until", 0) < time.time():
+            use_read_pool()
+
+        return func(*args, **kwargs)
+
+    return wrapper
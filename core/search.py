@@ -0,0 +1,383 @@
+import math
+import re
+from abc import ABC, abstractmethod
+from collections import namedtuple, Counter
+from functools import lru_cache
+from threading import Lock
+
+from sqlalchemy import text, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from core.instrumentation import count_call
+from core.utilities import get_morph_analyzer, Pagination
+from database.models import Topic, Comment, get_loader_profile
+
+# Виды документов в поисковом индексе. ID документа в индексе: ID объекта * 2 + вид документа
+TOPIC = 0
+COMMENT = 1
+
+# Результат поиска. Для найденной темы comment равен None
+SearchResult = namedtuple("SearchResult", ["topic", "comment"])
+
+word_pattern = re.compile(r"\w+")
+__index = None
+__index_lock = Lock()
+
+
+def get_document_id(kind: int, object_id: int) -> int:
+    """Получить ID документа в поисковом индексе"""
+    return object_id * 2 + kind
+
+
+@lru_cache(maxsize=100000)
+def normalize_word(word: str) -> str:
+    """Привести слово к начальной форме (для русских слов используется pymorphy2)"""
+    if not re.search("[а-яё]", word):
+        return word
+
+    count_call("pymorphy2")
+    return get_morph_analyzer().parse(word)[0].normal_form.replace("ё", "е")
+
+
+def normalize_text(source: str) -> str:
+    """Привести все слова текста к начальной форме. Результат - слова через пробел"""
+    return " ".join(normalize_word(word) for word in word_pattern.findall(source.lower()))
+
+
+class SearchIndex(ABC):
+    """
+    Поисковый индекс. Документы хранятся в виде нормализованного текста (см. normalize_text): заголовок отдельно
+    от основного текста, чтобы совпадения в заголовке были важнее
+
+    Методы принимают executor - сессию или соединение с базой данных, через которое изменяется индекс
+    """
+
+    @abstractmethod
+    def add_many(self, executor, documents: list):
+        """
+        Добавить или заменить документы в индексе
+
+        :arg documents: список кортежей (ID документа, нормализованный заголовок, нормализованный текст)
+        """
+
+    @abstractmethod
+    def remove(self, executor, document_ids: list):
+        """Удалить документы из индекса"""
+
+    @abstractmethod
+    def clear(self, executor):
+        """Удалить все документы из индекса"""
+
+    @abstractmethod
+    def search(self, executor, words: list, offset: int, limit: int) -> list:
+        """Получить ID документов, содержащих все слова, в порядке релевантности"""
+
+    @abstractmethod
+    def count(self, executor, words: list) -> int:
+        """Посчитать документы, содержащие все слова"""
+
+
+class Fts5SearchIndex(SearchIndex):
+    """Поисковый индекс в виртуальной таблице SQLite FTS5. Изменения индекса попадают в транзакцию сессии"""
+    table = "search_index"
+
+    def create(self, executor) -> bool:
+        """Создать таблицу индекса. Возвращает True, если таблицы раньше не было"""
+        exists = executor.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": self.table}
+        ).first()
+        executor.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5(title, text)"))
+
+        return exists is None
+
+    def add_many(self, executor, documents: list):
+        if documents:
+            self.remove(executor, [document_id for document_id, _, _ in documents])
+            executor.execute(
+                text(f"INSERT INTO {self.table} (rowid, title, text) VALUES (:id, :title, :text)"),
+                [{"id": document_id, "title": title, "text": body} for document_id, title, body in documents]
+            )
+
+    def remove(self, executor, document_ids: list):
+        if document_ids:
+            executor.execute(
+                text(f"DELETE FROM {self.table} WHERE rowid = :id"), [{"id": i} for i in document_ids]
+            )
+
+    def clear(self, executor):
+        executor.execute(text(f"DELETE FROM {self.table}"))
+
+    @staticmethod
+    def get_match_expression(words: list) -> str:
+        # Каждое слово берётся в кавычки, чтобы оно не было воспринято как оператор FTS5
+        return " ".join(f'"{word}"' for word in words)
+
+    def search(self, executor, words: list, offset: int, limit: int) -> list:
+        rows = executor.execute(
+            text(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH :match "
+                 f"ORDER BY bm25({self.table}, 2.0, 1.0) LIMIT :limit OFFSET :offset"),
+            {"match": self.get_match_expression(words), "limit": limit, "offset": offset}
+        )
+        return [row[0] for row in rows]
+
+    def count(self, executor, words: list) -> int:
+        return executor.execute(
+            text(f"SELECT count(*) FROM {self.table} WHERE {self.table} MATCH :match"),
+            {"match": self.get_match_expression(words)}
+        ).scalar()
+
+
+class MemorySearchIndex(SearchIndex):
+    """
+    Инвертированный индекс в памяти процесса на случай, когда база данных не поддерживает FTS5. Изменения
+    применяются сразу, без учёта транзакции, и индекс строится заново при каждом запуске приложения. У каждого
+    процесса свой индекс, который не видит изменений из других процессов, поэтому сервер с таким индексом
+    запускается только с одним процессом (см. gunicorn.conf.py)
+    """
+
+    def __init__(self):
+        self.postings = {}  # слово -> {ID документа: вес слова в документе}
+        self.documents = {}  # ID документа -> слова документа
+        self.lock = Lock()
+        # Последний результат ранжирования: количество результатов и страница запрашиваются по одному запросу
+        self.last_rank = (None, [])
+
+    def add_many(self, executor, documents: list):
+        with self.lock:
+            self.last_rank = (None, [])
+
+            for document_id, title, body in documents:
+                self.__remove(document_id)
+
+                # Слова из заголовка весят в два раза больше слов из текста
+                weights = Counter(body.split())
+                for word in title.split():
+                    weights[word] += 2
+
+                self.documents[document_id] = list(weights)
+                for word, weight in weights.items():
+                    self.postings.setdefault(word, {})[document_id] = weight
+
+    def __remove(self, document_id: int):
+        for word in self.documents.pop(document_id, []):
+            postings = self.postings[word]
+            del postings[document_id]
+
+            if not postings:
+                del self.postings[word]
+
+    def remove(self, executor, document_ids: list):
+        with self.lock:
+            self.last_rank = (None, [])
+
+            for document_id in document_ids:
+                self.__remove(document_id)
+
+    def clear(self, executor):
+        with self.lock:
+            self.last_rank = (None, [])
+            self.postings.clear()
+            self.documents.clear()
+
+    def rank(self, words: list) -> list:
+        """Получить ID всех документов, содержащих все слова, в порядке релевантности (TF-IDF)"""
+        with self.lock:
+            key = frozenset(words)
+
+            if self.last_rank[0] == key:
+                return self.last_rank[1]
+
+            postings = [self.postings.get(word, {}) for word in key]
+
+            if not postings or not all(postings):
+                return []
+
+            postings.sort(key=len)
+            documents_count = len(self.documents)
+            scores = {}
+
+            for document_id in postings[0]:
+                if all(document_id in p for p in postings[1:]):
+                    scores[document_id] = sum(p[document_id] * math.log(documents_count / len(p)) for p in postings)
+
+            ranked = sorted(scores, key=lambda i: (-scores[i], i))
+            self.last_rank = (key, ranked)
+
+        return ranked
+
+    def search(self, executor, words: list, offset: int, limit: int) -> list:
+        return self.rank(words)[offset:offset + limit]
+
+    def count(self, executor, words: list) -> int:
+        return len(self.rank(words))
+
+
+def init_search(engine):
+    """
+    Выбрать реализацию поискового индекса: FTS5 для SQLite, иначе индекс в памяти. Новый индекс сразу заполняется
+    содержимым базы данных. Вызывается при запуске приложения, до обработки запросов
+    """
+    global __index
+
+    with __index_lock:
+        if __index is not None:
+            return
+
+        with engine.begin() as connection:
+            index = None
+
+            if engine.dialect.name == "sqlite":
+                try:
+                    index = Fts5SearchIndex()
+                    created = index.create(connection)
+                except OperationalError:  # SQLite собран без FTS5
+                    index = None
+
+            if index is None:
+                index = MemorySearchIndex()
+                created = True
+
+            if created:
+                reindex_documents(connection, index)
+
+        __index = index
+
+
+def is_process_local() -> bool:
+    """Проверить, что поисковый индекс хранится в памяти процесса и не видит изменений из других процессов"""
+    return isinstance(__index, MemorySearchIndex)
+
+
+def get_search_index(db_sess: Session) -> SearchIndex:
+    """Получить поисковый индекс"""
+    global __index
+
+    if __index is None:
+        init_search(db_sess.get_bind())
+
+    return __index
+
+
+def reindex_documents(executor, index: SearchIndex, batch_size: int = 1000):
+    """
+    Заново заполнить поисковый индекс темами и комментариями из базы данных
+
+    :arg executor: сессия или соединение с базой данных
+    :arg index: поисковый индекс
+    :arg batch_size: количество документов, добавляемых в индекс за один запрос
+    """
+    index.clear(executor)
+
+    topics = executor.execute(select(Topic.id, Topic.title, Topic.text))
+    for rows in topics.partitions(batch_size):
+        index.add_many(executor, [
+            (get_document_id(TOPIC, i), normalize_text(title or ""), normalize_text(body or ""))
+            for i, title, body in rows
+        ])
+
+    comments = executor.execute(select(Comment.id, Comment.text))
+    for rows in comments.partitions(batch_size):
+        index.add_many(executor, [(get_document_id(COMMENT, i), "", normalize_text(body)) for i, body in rows])
+
+
+def reindex(db_sess: Session):
+    """Заново заполнить поисковый индекс темами и комментариями из базы данных"""
+    reindex_documents(db_sess, get_search_index(db_sess))
+
+
+def index_topic(db_sess: Session, topic: Topic):
+    """Добавить или обновить тему в поисковом индексе"""
+    get_search_index(db_sess).add_many(db_sess, [
+        (get_document_id(TOPIC, topic.id), normalize_text(topic.title), normalize_text(topic.text))
+    ])
+
+
+def index_comment(db_sess: Session, comment: Comment):
+    """Добавить или обновить комментарий в поисковом индексе"""
+    get_search_index(db_sess).add_many(db_sess, [
+        (get_document_id(COMMENT, comment.id), "", normalize_text(comment.text))
+    ])
+
+
+def remove_comment(db_sess: Session, comment: Comment):
+    """Удалить комментарий из поискового индекса"""
+    get_search_index(db_sess).remove(db_sess, [get_document_id(COMMENT, comment.id)])
+
+
+class SearchPagination(Pagination):
+    def __init__(self, db_sess: Session, query: str, step: int = 10):
+        """
+        Результаты поиска по темам и комментариям, разделённые на страницы. Страница и количество результатов
+        запрашиваются у поискового индекса, затем загружаются только темы и комментарии текущей страницы
+
+        :arg db_sess: сессия базы данных
+        :arg query: поисковый запрос
+        :arg step: количество результатов на странице
+        """
+        super().__init__(None, step)
+        self.db_sess = db_sess
+        self.index = get_search_index(db_sess)
+        self.words = normalize_text(query).split()
+
+    def count_items(self) -> int:
+        return self.index.count(self.db_sess, self.words) if self.words else 0
+
+    def fetch_items(self, offset: int, limit: int) -> list:
+        if not self.words:
+            return []
+
+        document_ids = self.index.search(self.db_sess, self.words, offset, limit)
+        topic_ids = [i // 2 for i in document_ids if i % 2 == TOPIC]
+        comment_ids = [i // 2 for i in document_ids if i % 2 == COMMENT]
+
+        topics = {
+            t.id: t for t in self.db_sess.query(Topic).options(*get_loader_profile("topic_preview")).filter(
+                Topic.id.in_(topic_ids)
+            )
+        }
+        comments = {
+            c.id: c for c in self.db_sess.query(Comment).options(*get_loader_profile("search_comment")).filter(
+                Comment.id.in_(comment_ids)
+            )
+        }
+
+        # Документы, объекты которых уже удалены из базы данных, пропускаются
+        results = []
+        for document_id in document_ids:
+            if document_id % 2 == TOPIC and document_id // 2 in topics:
+                results.append(SearchResult(topics[document_id // 2], None))
+            elif document_id % 2 == COMMENT and document_id // 2 in comments:
+                comment = comments[document_id // 2]
+                if comment.topic:
+                    results.append(SearchResult(comment.topic, comment))
+
+        return results
+
+    def iter_items(self, offset: int, limit: int, batch_size: int) -> list:
+        return self.fetch_items(offset, limit)
+
+    def find_page(self, item) -> int:
+        if item.comment is not None:
+            document_id = get_document_id(COMMENT, item.comment.id)
+        else:
+            document_id = get_document_id(TOPIC, item.topic.id)
+
+        # Загружаем только ID документов, а не темы и комментарии
+        document_ids = self.index.search(self.db_sess, self.words, 0, self.get_items_length()) if self.words else []
+
+        if document_id not in document_ids:
+            raise ValueError(f"{item!r} is not in pagination")
+
+        return document_ids.index(document_id) // self.step + 1
+
+
+def search(db_sess: Session, query: str, step: int = 10) -> SearchPagination:
+    """
+    Найти темы и комментарии по запросу. Учитываются все слова запроса в любой форме
+
+    :arg db_sess: сессия базы данных
+    :arg query: поисковый запрос
+    :arg step: количество результатов на странице
+    """
+    return SearchPagination(db_sess, query, step)
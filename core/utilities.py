@@ -1,12 +1,84 @@
 from datetime import datetime
+from functools import lru_cache
+from math import ceil
 from typing import Iterable
 
-import pymorphy2
-from flask import render_template
+from flask import render_template, g, has_request_context, current_app, stream_with_context, Response
+from sqlalchemy import inspect
+from sqlalchemy.orm import Query
 
-morphy = pymorphy2.MorphAnalyzer()
-months = ("январь", "февраль", "март", "апрель", "май", "июнь", "июль", "август", "сентябрь", "октябрь", "ноябрь",
-          "декабрь")
+from core.instrumentation import timed, count_call
+
+# Названия месяцев в родительном падеже ("1 января")
+months_genitive = ("января", "февраля", "марта", "апреля", "мая", "июня", "июля", "августа", "сентября", "октября",
+                   "ноября", "декабря")
+
+
+# Слова, которые согласуются с числом в шаблонах и в get_created_time
+INFLECTED_WORDS = ("ответ", "тема", "час", "минута", "секунда")
+# Заранее подготовленные формы этих слов в винительном падеже для каждого класса согласования с числом, чтобы
+# при обычной работе сайта не загружать словари pymorphy2
+INFLECTIONS = {
+    ("ответ", "accs", 1): "ответ", ("ответ", "accs", 2): "ответа", ("ответ", "accs", 5): "ответов",
+    ("тема", "accs", 1): "тему", ("тема", "accs", 2): "темы", ("тема", "accs", 5): "тем",
+    ("час", "accs", 1): "час", ("час", "accs", 2): "часа", ("час", "accs", 5): "часов",
+    ("минута", "accs", 1): "минуту", ("минута", "accs", 2): "минуты", ("минута", "accs", 5): "минут",
+    ("секунда", "accs", 1): "секунду", ("секунда", "accs", 2): "секунды", ("секунда", "accs", 5): "секунд",
+}
+
+
+@lru_cache(maxsize=None)
+def get_morph_analyzer():
+    """
+    Получить морфологический анализатор pymorphy2. Анализатор загружает словари (десятки мегабайт), поэтому он
+    создаётся при первом использовании, а не при импорте модуля
+    """
+    import pymorphy2
+
+    return pymorphy2.MorphAnalyzer()
+
+
+def get_plural_class(number: int) -> int:
+    """
+    Получить класс согласования слова с числом в русском языке. Возвращается наименьшее число этого класса: 1 (один
+    ответ), 2 (два ответа) или 5 (пять ответов)
+
+    :arg number: число, с которым нужно согласовать слово
+    """
+    if number % 10 == 1 and number % 100 != 11:
+        return 1
+    elif 2 <= number % 10 <= 4 and not 12 <= number % 100 <= 14:
+        return 2
+    else:
+        return 5
+
+
+@lru_cache(maxsize=None)
+def inflect_word(word: str, case: str, plural_class: int) -> str:
+    """
+    Просклонять слово в падеже и согласовать его с числом. Результат запоминается, поэтому морфологический
+    разбор каждого слова выполняется один раз за время работы процесса
+
+    :arg word: слово в начальной форме
+    :arg case: падеж (граммема pymorphy2, например "accs")
+    :arg plural_class: класс согласования с числом (см. get_plural_class)
+    """
+    if (word, case, plural_class) in INFLECTIONS:
+        return INFLECTIONS[word, case, plural_class]
+
+    count_call("pymorphy2")
+    return get_morph_analyzer().parse(word)[0].inflect({case}).make_agree_with_number(plural_class).word
+
+
+def warm_up_inflections(words: Iterable[str] = INFLECTED_WORDS):
+    """
+    Заранее просклонять слова, чтобы первые запросы не тратили время на морфологический разбор
+
+    :arg words: слова в начальной форме
+    """
+    for word in words:
+        for plural_class in (1, 2, 5):
+            inflect_word(word, "accs", plural_class)
 
 
 def make_agree_with_number(number: int, word: str, without_number: bool = False) -> str:
@@ -17,61 +89,152 @@ def make_agree_with_number(number: int, word: str, without_number: bool = False)
     :arg word: слово, которое нужно согласовать с числом
     :arg without_number: получить только слово согласованное с числом
     """
-    word = morphy.parse(word)[0].inflect({'accs'}).make_agree_with_number(number).word
+    word = inflect_word(word, "accs", get_plural_class(number))
 
     return word if without_number else f"{number} {word}"
 
 
 def render(template_name_or_list, **context):
     """render_template из Flask, но с поставленными по умолчанию некоторыми параметрами"""
-    return render_template(template_name_or_list, make_agree_with_number=make_agree_with_number, **context)
+    with timed("render"):
+        return render_template(template_name_or_list, make_agree_with_number=make_agree_with_number, **context)
+
+
+def shorten_words(source: str, words_limit: int) -> str:
+    """
+    Сократить текст до первых слов. Если слов больше, чем words_limit, то в конце ставится многоточие
+
+    :arg source: текст
+    :arg words_limit: максимальное количество слов
+    """
+    if source is None:
+        return None
+
+    # Разделяем не больше, чем нужно: остаток текста попадёт в последний элемент
+    words = source.split(maxsplit=words_limit)
+
+    if len(words) > words_limit:
+        return " ".join(words[:words_limit]) + "..."
+    else:
+        return source
+
+
+def render_stream(template_name: str, **context) -> Response:
+    """
+    Потоковый вариант render: страница отправляется частями по мере рендера шаблона, поэтому начало страницы уходит
+    клиенту до того, как загружены и отрендерены все элементы. В части собирается STREAM_BUFFER_SIZE кусков шаблона
+    """
+    app = current_app._get_current_object()
+    context.setdefault("make_agree_with_number", make_agree_with_number)
+    app.update_template_context(context)
+
+    template_stream = app.jinja_env.get_template(template_name).stream(context)
+    template_stream.enable_buffering(app.config.get("STREAM_BUFFER_SIZE", 16))
 
+    return Response(stream_with_context(timed_chunks(template_stream)), mimetype="text/html")
 
-def get_created_time(time: datetime) -> str:
-    """Возвращает дату в человеческом формате"""
-    time_now = datetime.now()
-    passed_time = datetime.now() - time
+
+def timed_chunks(chunks):
+    """Отдавать части потокового ответа, добавляя время их рендера к этапу render (см. core/instrumentation.py)"""
+    chunks = iter(chunks)
+
+    while True:
+        with timed("render"):
+            chunk = next(chunks, None)
+
+        if chunk is None:
+            return
+
+        yield chunk
+
+
+def get_now() -> datetime:
+    """Получить текущее время. Во время обработки запроса время запоминается, и все даты страницы считаются от него"""
+    if not has_request_context():
+        return datetime.now()
+
+    if "now" not in g:
+        g.now = datetime.now()
+
+    return g.now
+
+
+def get_created_time(time: datetime, now: datetime = None) -> str:
+    """
+    Возвращает дату в человеческом формате
+
+    :arg time: дата и время
+    :arg now: текущее время (по умолчанию время текущего запроса)
+    """
+    time_now = now or get_now()
+    passed_seconds = (time_now - time).total_seconds()
 
     if time.year != time_now.year:
-        return f"{time.day} {morphy.parse(months[time.month - 1])[0].inflect({'gent'}).word} {time.year}"
-    elif passed_time.total_seconds() // 86400 >= 2:
-        return f"{time.day} {morphy.parse(months[time.month - 1])[0].inflect({'gent'}).word} в {time.strftime('%H:%M')}"
-    elif passed_time.total_seconds() // 86400 == 1:
+        return f"{time.day} {months_genitive[time.month - 1]} {time.year}"
+    elif passed_seconds // 86400 >= 2:
+        return f"{time.day} {months_genitive[time.month - 1]} в {time.strftime('%H:%M')}"
+    elif passed_seconds // 86400 == 1:
         return f"Вчера в {time.strftime('%H:%M')}"
-    elif passed_time.total_seconds() // 3600 >= 4:
+    elif passed_seconds // 3600 >= 4:
         return f"Сегодня в {time.strftime('%H:%M')}"
-    elif passed_time.total_seconds() // 3600 != 0:
-        t = int(passed_time.total_seconds() // 3600)
+    elif passed_seconds // 3600 != 0:
+        t = int(passed_seconds // 3600)
         return f"{make_agree_with_number(t, 'час', t == 1)} назад".capitalize()
-    elif passed_time.total_seconds() // 60 > 0:
-        t = int(passed_time.total_seconds() // 60)
+    elif passed_seconds // 60 > 0:
+        t = int(passed_seconds // 60)
         return f"{make_agree_with_number(t, 'минута', t == 1)} назад".capitalize()
-    elif int(passed_time.total_seconds()) != 0:
-        t = int(passed_time.total_seconds())
+    elif int(passed_seconds) != 0:
+        t = int(passed_seconds)
         return f"{make_agree_with_number(t, 'секунда', t == 1)} назад".capitalize()
     else:
         return "Только что"
 
 
+def format_created_times(times: Iterable[datetime], now: datetime = None) -> list:
+    """
+    Перевести в человеческий формат сразу несколько дат (например, все даты одной страницы) относительно
+    одного и того же текущего времени
+
+    :arg times: даты и время
+    :arg now: текущее время (по умолчанию время текущего запроса)
+    """
+    now = now or get_now()
+    return [get_created_time(time, now) for time in times]
+
+
 class Pagination:
-    def __init__(self, items: Iterable, step: int):
+    def __init__(self, query: Query, step: int):
         """
-        Разделить список элементов на страницы
+        Разделить выборку из базы данных на страницы. Элементы запрашиваются у базы данных постранично
+        (LIMIT/OFFSET), а их общее количество - через COUNT(*), поэтому в памяти хранится только одна страница
 
-        :arg items: список элементов
+        :arg query: запрос SQLAlchemy с заданной сортировкой элементов
         :arg step: количество элементов на странице
         """
-        self.unprocessed_items = list(items)
-        self.paginated_items = [items[i:i + step] for i in range(0, len(items), step)]
+        self.query = query
         self.step = step
+        self.__items_length = None
+        self.__page = (None, [])
 
     def get_max_pages(self) -> int:
         """Получить максимальное количество страниц с элементами"""
-        return len(self.paginated_items)
+        return ceil(self.get_items_length() / self.step)
 
     def find_page(self, item) -> int:
         """Получить номер страницы, на которой находится элемент"""
-        return self.unprocessed_items.index(item) // self.step + 1
+        primary_key = inspect(item).mapper.primary_key[0]
+        item_id = inspect(item).identity[0]
+
+        # Загружаем только первичные ключи, а не целые строки
+        for index, (i,) in enumerate(self.query.with_entities(primary_key)):
+            if i == item_id:
+                return index // self.step + 1
+
+        raise ValueError(f"{item!r} is not in pagination")
+
+    def get_page_index(self, page: int) -> int:
+        """Получить индекс страницы (с нуля). При неверном номере страницы будет выдан индекс первой страницы"""
+        return page - 1 if 0 < page <= self.get_max_pages() else 0
 
     def get_page(self, page: int) -> list:
         """
@@ -79,19 +242,61 @@ class Pagination:
 
         :arg page: номер страницы (при неверном номере будет показана первая страница)
         """
-        if self.paginated_items:
-            if 0 < page <= self.get_max_pages():
-                index = page - 1
-            else:
-                index = 0
+        index = self.get_page_index(page)
+
+        # Повторный запрос той же страницы (например, из шаблона) не обращается к базе данных
+        if self.__page[0] != index:
+            self.__page = (index, self.fetch_items(index * self.step, self.step))
+
+        return self.__page[1]
+
+    def iter_page(self, page: int, batch_size: int = 50):
+        """
+        Перебрать элементы страницы по мере их чтения из базы данных, не загружая всю страницу в память (для
+        потокового рендера). Если страница уже загружена через get_page, то элементы берутся из неё
+
+        :arg page: номер страницы (при неверном номере будет показана первая страница)
+        :arg batch_size: количество строк, читаемых из курсора за раз
+        """
+        index = self.get_page_index(page)
 
-            return self.paginated_items[index]
+        if self.__page[0] == index:
+            yield from self.__page[1]
         else:
-            return []
+            yield from self.iter_items(index * self.step, self.step, batch_size)
 
     def get_items_length(self) -> int:
         """Получить общие количество элементов"""
-        return len(self.unprocessed_items)
+        if self.__items_length is None:
+            self.__items_length = self.count_items()
+
+        return self.__items_length
+
+    def fetch_items(self, offset: int, limit: int) -> list:
+        """
+        Загрузить элементы страницы из базы данных
+
+        :arg offset: количество пропускаемых элементов
+        :arg limit: количество элементов на странице
+        """
+        return self.query.offset(offset).limit(limit).all()
+
+    def iter_items(self, offset: int, limit: int, batch_size: int):
+        """
+        Перебрать элементы страницы, читая их из курсора базы данных порциями (yield_per)
+
+        :arg offset: количество пропускаемых элементов
+        :arg limit: количество элементов на странице
+        :arg batch_size: количество строк, читаемых из курсора за раз
+        """
+        return self.query.offset(offset).limit(limit).yield_per(batch_size)
+
+    def count_items(self) -> int:
+        """Посчитать элементы в базе данных"""
+        # Считаем только первичные ключи, чтобы подзапрос не выбирал целые строки
+        primary_key = inspect(self.query.column_descriptions[0]["entity"]).primary_key[0]
+        return self.query.order_by(None).with_entities(primary_key).count()
 
     def __iter__(self):
-        return iter(self.paginated_items)
+        for page in range(1, self.get_max_pages() + 1):
+            yield self.get_page(page)
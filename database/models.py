@@ -1,12 +1,59 @@
 import datetime
 import enum
+import math
 
 from flask_login import UserMixin
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, orm, Boolean, Enum
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, orm, Boolean, Enum, or_, and_, func, Index, \
+    Float
 
 from database.session import SqlAlchemyBase
-from core.utilities import get_created_time, Pagination
+from core.utilities import get_created_time, Pagination, shorten_words
+from core.passwords import hash_password, verify_password, needs_rehash
+
+
+# Вклад комментария в популярность темы (Topic.hot_score) уменьшается вдвое за HOT_HALF_LIFE. Время отсчитывается
+# от HOT_EPOCH, чтобы значения были небольшими
+HOT_HALF_LIFE = datetime.timedelta(hours=12)
+HOT_EPOCH = datetime.datetime(2020, 1, 1)
+
+
+def get_hot_term(time: datetime.datetime) -> float:
+    """Получить вклад события (создания темы или комментария) в популярность темы в логарифмической шкале"""
+    return (time - HOT_EPOCH) / HOT_HALF_LIFE
+
+
+def add_hot_term(score: float, time: datetime.datetime) -> float:
+    """Добавить событие к популярности темы: log2(2 ** score + 2 ** term) без переполнения"""
+    term = get_hot_term(time)
+
+    if score is None:
+        return term
+
+    high, low = max(score, term), min(score, term)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def remove_hot_term(score: float, time: datetime.datetime) -> float:
+    """
+    Убрать событие из популярности темы: log2(2 ** score - 2 ** term). Возвращает None, если после вычитания
+    не осталось событий
+    """
+    term = get_hot_term(time)
+
+    if score is None or term >= score:
+        return None
+
+    return score + math.log2(1 - 2 ** (term - score))
+
+
+def get_hot_score(times) -> float:
+    """Посчитать популярность темы по времени всех событий (создания темы и комментариев)"""
+    score = None
+
+    for time in times:
+        score = add_hot_term(score, time)
+
+    return score
 
 
 class Role(enum.Enum):
@@ -27,19 +74,31 @@ class User(SqlAlchemyBase, UserMixin):
     hashed_password = Column(String, nullable=False)
     created_time = Column(DateTime, default=datetime.datetime.now)
 
-    topics = orm.relation("Topic", back_populates="author")
-    comments = orm.relation("Comment", back_populates="author")
+    # Темы и комментарии удаляются вместе с пользователем (ON DELETE CASCADE, см. database/queries.py delete_user)
+    topics = orm.relation("Topic", back_populates="author", passive_deletes=True)
+    comments = orm.relation("Comment", back_populates="author", passive_deletes=True)
 
     def is_admin(self):
         return self.role == Role.admin
 
     def set_password(self, password: str):
         """Поставить пароль"""
-        self.hashed_password = generate_password_hash(password)
+        self.hashed_password = hash_password(password)
 
     def check_password(self, password: str) -> bool:
         """Проверить пароль по хешу"""
-        return check_password_hash(self.hashed_password, password)
+        return verify_password(self.hashed_password, password)
+
+    def rehash_password(self, password: str) -> bool:
+        """
+        Пересоздать хеш уже проверенного пароля, если он создан не по текущей политике хеширования. Возвращает True,
+        если хеш изменён
+        """
+        if not needs_rehash(self.hashed_password):
+            return False
+
+        self.set_password(password)
+        return True
 
     def get_created_time(self) -> str:
         """Получить дату и время создания пользователя в удобном виде"""
@@ -49,38 +108,151 @@ class User(SqlAlchemyBase, UserMixin):
 class Category(SqlAlchemyBase):
     """Модель категории"""
     __tablename__ = "categories"
+    __table_args__ = (
+        # Отметка изменения форума для кэширования страниц: max(updated_at), количество категорий и сумма их счётчиков
+        Index("ix_categories_updated_at_topic_count", "updated_at", "topic_count"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String, unique=True)
     is_locked = Column(Boolean, default=False)
+    # Время последнего изменения строки (в том числе счётчиков), используется для инвалидации кэша
+    updated_at = Column(DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+    # Денормализованные счётчики, обновляются вместе с темами и комментариями
+    topic_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_activity_at = Column(DateTime, nullable=True)
 
-    topics = orm.relation("Topic", back_populates="category")
+    topics = orm.relation("Topic", back_populates="category", passive_deletes=True)
 
-    def get_topics_pagination(self, step: int = 10) -> Pagination:
+    def on_topic_added(self, topic):
+        """Обновить счётчики категории после добавления в неё темы"""
+        self.topic_count = Category.topic_count + 1
+
+        if self.last_activity_at is None or self.last_activity_at < topic.created_time:
+            self.last_activity_at = topic.created_time
+
+    def on_topic_removed(self, topic):
+        """Обновить счётчики категории после удаления из неё темы"""
+        self.topic_count = Category.topic_count - 1
+
+    def get_topics_pagination(self, step: int = 10, sort: str = "new") -> Pagination:
         """
         Получить разделить список тем на страницы
 
         :arg step: количество тем на странице
+        :arg sort: сортировка тем (см. TOPIC_SORTS)
         """
-        return Pagination(sorted(self.topics, key=lambda t: (t.is_pinned, t.created_time), reverse=True), step)
+        query = orm.object_session(self).query(Topic).options(*get_loader_profile("topic_preview")).filter(
+            Topic.category_id == self.id
+        ).order_by(Topic.is_pinned.desc(), TOPIC_SORTS[sort].desc(), Topic.id.desc())
+
+        return Pagination(query, step)
 
 
 class Topic(SqlAlchemyBase):
     """Модель темы"""
     __tablename__ = "topics"
+    __table_args__ = (
+        # Список тем категории и главная страница: WHERE category_id = ? ORDER BY is_pinned, created_time, id
+        Index("ix_topics_category_id_is_pinned_created_time", "category_id", "is_pinned", "created_time", "id"),
+        # Список тем без категории: WHERE category_id IS NULL ORDER BY created_time, id
+        Index("ix_topics_category_id_created_time", "category_id", "created_time", "id"),
+        # Те же списки с сортировками active и hot (см. TOPIC_SORTS)
+        Index("ix_topics_category_id_is_pinned_last_activity_at", "category_id", "is_pinned", "last_activity_at", "id"),
+        Index("ix_topics_category_id_is_pinned_hot_score", "category_id", "is_pinned", "hot_score", "id"),
+        Index("ix_topics_category_id_last_activity_at", "category_id", "last_activity_at", "id"),
+        Index("ix_topics_category_id_hot_score", "category_id", "hot_score", "id"),
+        Index("ix_topics_author_id", "author_id"),
+        # Время последнего изменения форума для кэширования страниц: max(updated_at)
+        Index("ix_topics_updated_at", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    author_id = Column(Integer, ForeignKey("users.id"))
-    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    author_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), nullable=True)
     title = Column(String)
     text = Column(String)
+    # Сокращённые заголовок и текст для превью темы, обновляются при изменении заголовка и текста
+    short_title = Column(String)
+    excerpt = Column(String)
     is_pinned = Column(Boolean, default=False)
     is_locked = Column(Boolean, default=False)
     created_time = Column(DateTime, default=datetime.datetime.now)
+    # Время последнего изменения строки (в том числе счётчиков), используется для инвалидации кэша
+    updated_at = Column(DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+    # Денормализованные счётчики, обновляются вместе с комментариями
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_comment_at = Column(DateTime, nullable=True)
+    # Время последнего комментария или создания темы, сортировка active
+    last_activity_at = Column(DateTime, default=lambda context: context.get_current_parameters()["created_time"])
+    # Популярность темы, сортировка hot: log2 суммы 2 ** get_hot_term(t) по времени создания темы и комментариев.
+    # Вклад каждого события со временем уменьшается одинаково для всех тем, поэтому порядок тем меняется только при
+    # новом комментарии, и популярность не нужно пересчитывать: к сумме прибавляется одно слагаемое
+    hot_score = Column(Float, default=lambda context: get_hot_term(context.get_current_parameters()["created_time"]))
 
     author = orm.relation("User")
     category = orm.relation("Category")
-    comments = orm.relation("Comment", back_populates="topic")
+    comments = orm.relation("Comment", back_populates="topic", passive_deletes=True)
+
+    # Количество слов в сокращённых заголовке и тексте
+    SHORT_TITLE_WORDS = 12
+    EXCERPT_WORDS = 16
+
+    @orm.validates("title", "text")
+    def update_excerpts(self, key, value):
+        """Пересчитать сокращённые заголовок или текст при их изменении"""
+        if key == "title":
+            self.short_title = shorten_words(value, self.SHORT_TITLE_WORDS)
+        else:
+            self.excerpt = shorten_words(value, self.EXCERPT_WORDS)
+
+        return value
+
+    def on_comment_added(self, comment):
+        """
+        Обновить счётчики темы и её категории после добавления комментария. Вызывается после flush комментария,
+        когда транзакция уже получила блокировку записи
+        """
+        db_sess = orm.object_session(self)
+        # Популярность вычисляется в Python, поэтому перед изменением она читается заново (в серверных базах данных -
+        # с блокировкой строки): значение, загруженное до блокировки, не учитывало бы комментарии, сохранённые
+        # одновременно в других транзакциях. Блокировка FOR NO KEY UPDATE, а не FOR UPDATE: INSERT комментария уже
+        # держит FOR KEY SHARE на строке темы из-за внешнего ключа, и FOR UPDATE у двух одновременных авторов
+        # ждал бы друг друга (взаимная блокировка). FOR NO KEY UPDATE совместим с FOR KEY SHARE
+        db_sess.flush()
+        db_sess.refresh(self, ["hot_score"], with_for_update={"key_share": True})
+
+        self.comment_count = Topic.comment_count + 1
+        self.last_comment_at = comment.created_time
+        self.last_activity_at = comment.created_time
+        self.hot_score = add_hot_term(self.hot_score, comment.created_time)
+
+        self.touch()
+
+        if self.category:
+            self.category.last_activity_at = comment.created_time
+
+    def on_comment_removed(self, comment):
+        """Обновить счётчики темы после удаления комментария"""
+        self.comment_count = Topic.comment_count - 1
+        self.last_comment_at = orm.object_session(self).query(func.max(Comment.created_time)).filter(
+            Comment.topic_id == self.id, Comment.id != comment.id
+        ).scalar()
+        self.last_activity_at = self.last_comment_at or self.created_time
+        self.hot_score = remove_hot_term(self.hot_score, comment.created_time)
+
+        if self.hot_score is None:
+            self.hot_score = get_hot_term(self.created_time)
+
+        self.touch()
+
+    def touch(self):
+        """Отметить изменение темы, чтобы страницы темы и её категории в кэше считались устаревшими"""
+        now = datetime.datetime.now()
+        self.updated_at = now
+
+        if self.category:
+            self.category.updated_at = now
 
     def get_created_time(self) -> str:
         """Получить дату и время создания темы в удобном виде"""
@@ -92,18 +264,33 @@ class Topic(SqlAlchemyBase):
 
         :arg step: количество комментариев на странице
         """
-        return Pagination(sorted(self.comments, key=lambda c: c.created_time), step)
+        query = orm.object_session(self).query(Comment).options(*get_loader_profile("comment")).filter(
+            Comment.topic_id == self.id
+        ).order_by(Comment.created_time, Comment.id)
+
+        return Pagination(query, step)
 
 
 class Comment(SqlAlchemyBase):
     """Модель комментария в теме"""
     __tablename__ = "comments"
+    __table_args__ = (
+        # Страница темы и поиск страницы комментария: WHERE topic_id = ? ORDER BY created_time, id
+        Index("ix_comments_topic_id_created_time", "topic_id", "created_time", "id"),
+        Index("ix_comments_author_id", "author_id"),
+        # Повторная отправка той же формы не создаёт второй комментарий
+        Index("ix_comments_submission_key", "submission_key", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    author_id = Column(Integer, ForeignKey("users.id"))
-    topic_id = Column(Integer, ForeignKey("topics.id"))
+    author_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    topic_id = Column(Integer, ForeignKey("topics.id", ondelete="CASCADE"))
     text = Column(String, nullable=False)
     created_time = Column(DateTime, default=datetime.datetime.now)
+    # Время последнего изменения строки, используется для инвалидации кэша
+    updated_at = Column(DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+    # Ключ отправки формы комментария (см. CommentForm.submission_key)
+    submission_key = Column(String(32), nullable=True)
 
     author = orm.relation("User")
     topic = orm.relation("Topic")
@@ -111,3 +298,71 @@ class Comment(SqlAlchemyBase):
     def get_created_time(self) -> str:
         """Получить дату и время создания комментария в удобном виде"""
         return get_created_time(self.created_time)
+
+    def get_page(self, step: int = 10) -> int:
+        """
+        Получить номер страницы темы, на которой находится комментарий. Позиция комментария определяется одним
+        запросом COUNT(*), без загрузки остальных комментариев темы
+
+        :arg step: количество комментариев на странице
+        """
+        position = orm.object_session(self).query(Comment).filter(
+            Comment.topic_id == self.topic_id,
+            or_(
+                Comment.created_time < self.created_time,
+                and_(Comment.created_time == self.created_time, Comment.id < self.id)
+            )
+        ).count()
+
+        return position // step + 1
+
+
+# Сортировки списков тем: название -> столбец, по убыванию которого сортируются темы (new - новые темы, active - по
+# последнему комментарию, hot - по количеству недавних комментариев). Для каждой сортировки есть индекс
+TOPIC_SORTS = {
+    "new": Topic.created_time,
+    "active": Topic.last_activity_at,
+    "hot": Topic.hot_score,
+}
+
+# Профили загрузки связей для страниц со списками. Связи, которые показываются в шаблоне, загружаются вместе
+# с основным запросом, а загрузка коллекций комментариев и тем запрещена, чтобы не было запросов N+1
+LOADER_PROFILES = {
+    # Превью темы на главной странице, в категориях и поиске. Полный текст темы не загружается
+    "topic_preview": (
+        orm.load_only(
+            Topic.id, Topic.author_id, Topic.category_id, Topic.title, Topic.short_title, Topic.excerpt,
+            Topic.is_pinned, Topic.is_locked, Topic.created_time, Topic.updated_at, Topic.comment_count
+        ),
+        orm.joinedload(Topic.author).load_only(User.id, User.username),
+        orm.raiseload(Topic.comments),
+    ),
+    # Тема на собственной странице
+    "topic_page": (
+        orm.joinedload(Topic.author).load_only(User.id, User.username),
+        orm.raiseload(Topic.comments),
+    ),
+    # Комментарий на странице темы
+    "comment": (
+        orm.joinedload(Comment.author).load_only(User.id, User.username),
+        orm.raiseload(Comment.topic),
+    ),
+    # Комментарий в результатах поиска
+    "search_comment": (
+        orm.joinedload(Comment.author).load_only(User.id, User.username),
+        orm.joinedload(Comment.topic).load_only(Topic.id, Topic.title, Topic.is_locked),
+    ),
+    # Категория на главной странице
+    "category_preview": (
+        orm.raiseload(Category.topics),
+    ),
+}
+
+
+def get_loader_profile(name: str) -> tuple:
+    """
+    Получить параметры загрузки связей для запроса (query.options)
+
+    :arg name: название профиля из LOADER_PROFILES
+    """
+    return LOADER_PROFILES[name]
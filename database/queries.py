@@ -0,0 +1,355 @@
+from sqlalchemy import func, select, inspect, update, bindparam
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from core import search as forum_search
+from core.cache import Cache
+from database.models import User, Topic, Category, Comment, get_loader_profile, get_hot_term, add_hot_term
+from database.session import on_change
+
+# Раскладка главной страницы: ID категорий, ID показываемых тем и количество тем в каждой категории. Время жизни
+# ограничено, чтобы другие процессы приложения тоже увидели изменения
+front_page_cache = Cache(max_size=16, ttl=60)
+
+
+# Комментарии изменяют счётчики и время активности тем и категорий, но не раскладку, поэтому кэш сбрасывается только
+# после создания, удаления, закрепления, переноса и переименования тем и изменения категорий
+@on_change(Topic.category_id, Topic.is_pinned, Topic.created_time, Topic.title, Category.title, Category.topic_count)
+def invalidate_front_page():
+    """Сбросить кэш главной страницы"""
+    front_page_cache.clear()
+
+
+# Данные пользователей для загрузки авторизованного пользователя в начале запроса: ID -> значения столбцов. Время жизни
+# короткое, так как другие процессы приложения не узнают об изменении пользователя
+user_cache = Cache(max_size=4096, ttl=30)
+
+
+@on_change(User)
+def invalidate_users():
+    """Сбросить кэш пользователей (например, после изменения роли, логина или пароля)"""
+    user_cache.clear()
+
+
+def get_cached_user(db_sess: Session, user_id: int) -> User:
+    """
+    Получить пользователя по ID. Если пользователь есть в кэше, то он добавляется в сессию без запроса к базе данных
+    (merge с load=False), и следующие query(User).get в этом запросе тоже не обращаются к базе данных
+
+    :arg db_sess: сессия базы данных
+    :arg user_id: ID пользователя
+    """
+    values = user_cache.get(user_id)
+
+    if values is None:
+        # Значения читаются одним запросом по столбцам, а не из объекта: пользователь может быть уже загружен в сессию
+        # не полностью (например, автор темы в профиле topic_page), и чтение его атрибутов выполнило бы отдельный
+        # запрос на каждый незагруженный столбец
+        attributes = inspect(User).column_attrs
+        row = db_sess.execute(
+            select(*(attribute.columns[0].label(attribute.key) for attribute in attributes)).where(User.id == user_id)
+        ).mappings().first()
+
+        if row is None:
+            return None
+
+        values = dict(row)
+        user_cache.set(user_id, values)
+
+    user = User(**values)
+    make_transient_to_detached(user)
+
+    return db_sess.merge(user, load=False)
+
+
+def get_front_page_layout(db_sess: Session, topics_limit: int = 3) -> list:
+    """
+    Получить раскладку главной страницы: список кортежей (ID категории, ID первых тем, количество тем в категории).
+    Темы без категории имеют ID категории None
+
+    :arg db_sess: сессия базы данных
+    :arg topics_limit: количество тем, которые показываются для каждой категории
+    """
+    layout = front_page_cache.get(topics_limit)
+
+    if layout is not None:
+        return layout
+
+    # Нумеруем темы внутри каждой категории в порядке их показа и берём только первые
+    ranked = db_sess.query(
+        Topic.id.label("id"),
+        Topic.category_id.label("category_id"),
+        func.row_number().over(
+            partition_by=Topic.category_id,
+            order_by=(Topic.is_pinned.desc(), Topic.created_time.desc(), Topic.id.desc())
+        ).label("row_number")
+    ).subquery()
+    top_topics = db_sess.query(ranked.c.category_id, ranked.c.id).filter(
+        ranked.c.row_number <= topics_limit
+    ).order_by(ranked.c.category_id, ranked.c.row_number)
+
+    topic_ids = {}
+    for category_id, topic_id in top_topics:
+        topic_ids.setdefault(category_id, []).append(topic_id)
+
+    # Количество тем берётся из денормализованного счётчика категории, а не подсчётом всех тем
+    counts = {}
+    titles = {}
+    for category_id, title, topic_count in db_sess.query(Category.id, Category.title, Category.topic_count).filter(
+        Category.id.in_(topic_ids)
+    ):
+        counts[category_id] = topic_count
+        titles[category_id] = title
+
+    if None in topic_ids:
+        counts[None] = db_sess.query(func.count(Topic.id)).filter(Topic.category_id == None).scalar()
+
+    # Категории идут в обратном алфавитном порядке, темы без категории - в конце
+    layout = sorted(
+        ((category_id, topic_ids[category_id], count) for category_id, count in counts.items()),
+        key=lambda c: "" if c[0] is None else titles.get(c[0], ""),
+        reverse=True
+    )
+    front_page_cache.set(topics_limit, layout)
+
+    return layout
+
+
+def get_front_page(db_sess: Session, topics_limit: int = 3) -> list:
+    """
+    Получить содержимое главной страницы: список кортежей (категория, первые темы, количество тем в категории).
+    Для тем без категории вместо категории указывается None
+
+    :arg db_sess: сессия базы данных
+    :arg topics_limit: количество тем, которые показываются для каждой категории
+    """
+    layout = get_front_page_layout(db_sess, topics_limit)
+
+    # Загружаем только те темы и категории, которые будут показаны
+    category_ids = [category_id for category_id, _, _ in layout if category_id is not None]
+    topic_ids = [topic_id for _, ids, _ in layout for topic_id in ids]
+    categories = {
+        c.id: c for c in db_sess.query(Category).options(*get_loader_profile("category_preview")).filter(
+            Category.id.in_(category_ids)
+        )
+    }
+    topics = {
+        t.id: t for t in db_sess.query(Topic).options(*get_loader_profile("topic_preview")).filter(
+            Topic.id.in_(topic_ids)
+        )
+    }
+
+    return [
+        (categories.get(category_id), [topics[i] for i in ids if i in topics], count)
+        for category_id, ids, count in layout
+        if category_id is None or category_id in categories
+    ]
+
+
+def get_batches(ids, batch_size: int):
+    """Разделить ID на части не больше batch_size (например, для условия IN)"""
+    ids = list(ids)
+    return [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+
+
+def repair_counters(db_sess: Session, topic_ids=None, category_ids=None, batch_size: int = 500):
+    """
+    Пересчитать денормализованные счётчики тем и категорий. Пересчёт делается несколькими UPDATE-запросами
+    с подзапросами, без загрузки строк в память
+
+    :arg db_sess: сессия базы данных
+    :arg topic_ids: ID тем, счётчики которых нужно пересчитать (None - все темы)
+    :arg category_ids: ID категорий, счётчики которых нужно пересчитать (None - все категории)
+    :arg batch_size: количество ID в одном UPDATE-запросе
+    """
+    topic_filters = [None] if topic_ids is None else [Topic.id.in_(b) for b in get_batches(topic_ids, batch_size)]
+    category_filters = [None] if category_ids is None else \
+        [Category.id.in_(b) for b in get_batches(category_ids, batch_size)]
+
+    for condition in topic_filters:
+        query = db_sess.query(Topic)
+        if condition is not None:
+            query = query.filter(condition)
+
+        last_comment_at = select(func.max(Comment.created_time)).where(Comment.topic_id == Topic.id).scalar_subquery()
+        query.update({
+            Topic.comment_count: select(func.count(Comment.id)).where(Comment.topic_id == Topic.id).scalar_subquery(),
+            Topic.last_comment_at: last_comment_at,
+            Topic.last_activity_at: func.coalesce(last_comment_at, Topic.created_time),
+        }, synchronize_session=False)
+
+    repair_hot_scores(db_sess, topic_ids, batch_size)
+
+    for condition in category_filters:
+        query = db_sess.query(Category)
+        if condition is not None:
+            query = query.filter(condition)
+
+        query.update({
+            Category.topic_count: select(func.count(Topic.id)).where(
+                Topic.category_id == Category.id
+            ).scalar_subquery(),
+            Category.last_activity_at: select(
+                func.max(func.coalesce(Topic.last_comment_at, Topic.created_time))
+            ).where(Topic.category_id == Category.id).scalar_subquery()
+        }, synchronize_session=False)
+
+
+def repair_hot_scores(db_sess: Session, topic_ids=None, batch_size: int = 500):
+    """
+    Пересчитать популярность тем (Topic.hot_score) по времени создания тем и их комментариев. Популярность
+    вычисляется в Python, время комментариев читается частями по batch_size тем
+
+    :arg db_sess: сессия базы данных
+    :arg topic_ids: ID тем, популярность которых нужно пересчитать (None - все темы)
+    :arg batch_size: количество тем в одной части
+    """
+    if topic_ids is None:
+        topic_ids = [topic_id for (topic_id,) in db_sess.query(Topic.id)]
+
+    for batch in get_batches(topic_ids, batch_size):
+        scores = {
+            topic_id: get_hot_term(created_time)
+            for topic_id, created_time in db_sess.query(Topic.id, Topic.created_time).filter(Topic.id.in_(batch))
+        }
+        comments = db_sess.query(Comment.topic_id, Comment.created_time).filter(Comment.topic_id.in_(batch))
+
+        for topic_id, created_time in comments.yield_per(10000):
+            scores[topic_id] = add_hot_term(scores[topic_id], created_time)
+
+        if scores:
+            db_sess.execute(
+                update(Topic.__table__).where(Topic.id == bindparam("topic_id")).values(hot_score=bindparam("score")),
+                [{"topic_id": topic_id, "score": score} for topic_id, score in scores.items()]
+            )
+
+
+def delete_comments(db_sess: Session, condition, batch_size: int = 500) -> set:
+    """
+    Удалить комментарии по условию частями по batch_size: загружаются только ID, строки удаляются запросом
+    DELETE ... WHERE id IN (...), документы удаляются из поискового индекса. Счётчики тем не пересчитываются.
+    Возвращает ID тем, из которых были удалены комментарии
+
+    :arg db_sess: сессия базы данных
+    :arg condition: условие для комментариев
+    :arg batch_size: количество комментариев, удаляемых за один запрос
+    """
+    index = forum_search.get_search_index(db_sess)
+    topic_ids = set()
+
+    while True:
+        rows = db_sess.execute(select(Comment.id, Comment.topic_id).where(condition).limit(batch_size)).all()
+
+        if not rows:
+            return topic_ids
+
+        comment_ids = [i for i, _ in rows]
+        topic_ids.update(topic_id for _, topic_id in rows)
+
+        db_sess.query(Comment).filter(Comment.id.in_(comment_ids)).delete(synchronize_session=False)
+        index.remove(db_sess, [forum_search.get_document_id(forum_search.COMMENT, i) for i in comment_ids])
+
+
+def delete_topics(db_sess: Session, condition, batch_size: int = 500) -> set:
+    """
+    Удалить темы по условию вместе с их комментариями частями по batch_size (см. delete_comments). Счётчики
+    категорий не пересчитываются. Возвращает ID категорий, из которых были удалены темы
+
+    :arg db_sess: сессия базы данных
+    :arg condition: условие для тем
+    :arg batch_size: количество тем, удаляемых за один запрос
+    """
+    index = forum_search.get_search_index(db_sess)
+    category_ids = set()
+
+    while True:
+        rows = db_sess.execute(select(Topic.id, Topic.category_id).where(condition).limit(batch_size)).all()
+
+        if not rows:
+            category_ids.discard(None)
+            return category_ids
+
+        topic_ids = [i for i, _ in rows]
+        category_ids.update(category_id for _, category_id in rows)
+
+        delete_comments(db_sess, Comment.topic_id.in_(topic_ids), batch_size)
+        db_sess.query(Topic).filter(Topic.id.in_(topic_ids)).delete(synchronize_session=False)
+        index.remove(db_sess, [forum_search.get_document_id(forum_search.TOPIC, i) for i in topic_ids])
+
+
+def delete_topic(db_sess: Session, topic: Topic):
+    """Удалить тему вместе с комментариями и обновить счётчики её категории"""
+    category_ids = delete_topics(db_sess, Topic.id == topic.id)
+    repair_counters(db_sess, topic_ids=[], category_ids=category_ids)
+
+
+def delete_category(db_sess: Session, category: Category):
+    """Удалить категорию вместе с её темами и их комментариями"""
+    delete_topics(db_sess, Topic.category_id == category.id)
+    db_sess.query(Category).filter(Category.id == category.id).delete(synchronize_session=False)
+
+
+def delete_user(db_sess: Session, user: User):
+    """
+    Удалить пользователя вместе с его темами и комментариями, затем пересчитать счётчики тем, в которых он
+    оставлял комментарии, и категорий
+    """
+    topic_ids = delete_comments(db_sess, Comment.author_id == user.id)
+    category_ids = delete_topics(db_sess, Topic.author_id == user.id)
+
+    for batch in get_batches(topic_ids, 500):
+        category_ids.update(
+            category_id for (category_id,) in db_sess.execute(
+                select(Topic.category_id).where(Topic.id.in_(batch), Topic.category_id != None).distinct()
+            )
+        )
+
+    repair_counters(db_sess, topic_ids=topic_ids, category_ids=category_ids)
+    db_sess.query(User).filter(User.id == user.id).delete(synchronize_session=False)
+
+
+def get_forum_stamp(db_sess: Session) -> tuple:
+    """
+    Получить отметку изменения всего форума для кэширования страниц: время последнего изменения тем и категорий,
+    а также их количество, чтобы учесть удаление
+
+    :arg db_sess: сессия базы данных
+    """
+    topics_updated_at = db_sess.query(func.max(Topic.updated_at)).scalar()
+    # Количество тем в категориях берётся из денормализованных счётчиков, а не подсчётом всех тем
+    categories_updated_at, categories_count, categorized_count = db_sess.query(
+        func.max(Category.updated_at), func.count(Category.id), func.sum(Category.topic_count)
+    ).one()
+    # Темы без категории не учитываются счётчиками, они считаются по индексу category_id
+    uncategorized_count = db_sess.query(func.count(Topic.id)).filter(Topic.category_id == None).scalar()
+
+    return (
+        max(filter(None, (topics_updated_at, categories_updated_at)), default=None), categories_count,
+        categorized_count, uncategorized_count
+    )
+
+
+def get_topic_stamp(db_sess: Session, id: int) -> tuple:
+    """
+    Получить отметку изменения темы для кэширования её страниц. Если темы нет, то будет возвращён None
+
+    :arg db_sess: сессия базы данных
+    :arg id: ID темы
+    """
+    row = db_sess.query(Topic.updated_at).filter(Topic.id == id).first()
+    return None if row is None else (row.updated_at,)
+
+
+def get_category_stamp(db_sess: Session, id: str) -> tuple:
+    """
+    Получить отметку изменения категории для кэширования её страниц. Если категории нет, то будет возвращён None
+
+    :arg db_sess: сессия базы данных
+    :arg id: ID категории или no_category для тем без категории
+    """
+    if id == "no_category":
+        return get_forum_stamp(db_sess)
+    elif not id.isdigit():
+        return None
+
+    row = db_sess.query(Category.updated_at).filter(Category.id == int(id)).first()
+    return None if row is None else (row.updated_at,)
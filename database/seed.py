@@ -0,0 +1,159 @@
+"""
+Заполнение базы данных синтетическими пользователями, категориями, темами и комментариями для измерения
+производительности. Строки вставляются через Core (insert + executemany) частями, без создания объектов ORM,
+поэтому можно создать миллионы комментариев. Размеры тем распределены неравномерно: несколько тем с очень большим
+количеством комментариев и много тем с небольшим
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, func
+
+from core.utilities import shorten_words
+from core.passwords import hash_password
+from database.models import Role, User, Category, Topic, Comment, get_hot_score
+
+# Пароль всех созданных пользователей
+SEED_PASSWORD = "password"
+
+WORDS = (
+    "форум тема вопрос ответ код сервер база данных запрос страница пользователь категория комментарий поиск "
+    "python flask sqlalchemy шаблон индекс кэш ошибка версия проект модуль функция класс метод тест работа время "
+    "быстро медленно память процесс поток сеть файл список словарь строка число дата привет спасибо помогите"
+).split()
+
+
+def generate_text(rng: random.Random, min_words: int, max_words: int, paragraphs: int = 1) -> str:
+    """Сгенерировать текст из случайных слов"""
+    return "\n".join(
+        " ".join(rng.choices(WORDS, k=rng.randint(min_words, max_words))).capitalize() for _ in range(paragraphs)
+    )
+
+
+def get_thread_sizes(rng: random.Random, topics: int, comments: int, skew: float) -> list:
+    """
+    Распределить комментарии по темам по закону Ципфа: размер темы с рангом r пропорционален 1 / r ** skew
+
+    :arg topics: количество тем
+    :arg comments: общее количество комментариев
+    :arg skew: степень неравномерности (0 - все темы одного размера)
+    """
+    weights = [1 / rank ** skew for rank in range(1, topics + 1)]
+    total = sum(weights)
+    sizes = [int(comments * weight / total) for weight in weights]
+
+    # Остаток от округления раздаётся случайным темам
+    for i in rng.choices(range(topics), k=comments - sum(sizes)):
+        sizes[i] += 1
+
+    rng.shuffle(sizes)
+    return sizes
+
+
+def insert_batches(connection, table, rows, batch_size: int) -> int:
+    """Вставить строки частями по batch_size через executemany. Возвращает количество вставленных строк"""
+    batch = []
+    count = 0
+
+    for row in rows:
+        batch.append(row)
+
+        if len(batch) == batch_size:
+            connection.execute(insert(table), batch)
+            count += len(batch)
+            batch = []
+
+    if batch:
+        connection.execute(insert(table), batch)
+        count += len(batch)
+
+    return count
+
+
+def seed(engine, users: int = 1000, categories: int = 20, topics: int = 10000, comments: int = 100000,
+         skew: float = 1.1, batch_size: int = 10000, seed_value: int = 0, log=print):
+    """
+    Заполнить базу данных синтетическими данными. Данные добавляются к уже существующим
+
+    :arg engine: движок SQLAlchemy
+    :arg users: количество пользователей
+    :arg categories: количество категорий
+    :arg topics: количество тем
+    :arg comments: количество комментариев
+    :arg skew: неравномерность размеров тем (см. get_thread_sizes)
+    :arg batch_size: количество строк в одном executemany
+    :arg seed_value: начальное значение генератора случайных чисел
+    :arg log: функция для вывода хода заполнения
+    """
+    rng = random.Random(seed_value)
+    now = datetime.now()
+    start = now - timedelta(days=365)
+    hashed_password = hash_password(SEED_PASSWORD)
+
+    with engine.begin() as connection:
+        first_user, first_category, first_topic, first_comment = (
+            (connection.execute(select(func.max(model.id))).scalar() or 0) + 1
+            for model in (User, Category, Topic, Comment)
+        )
+
+        insert_batches(connection, User.__table__, (
+            {"id": first_user + i, "username": f"user{first_user + i}", "email": f"user{first_user + i}@example.com",
+             "role": Role.user, "hashed_password": hashed_password, "created_time": start}
+            for i in range(users)
+        ), batch_size)
+        log(f"Пользователи: {users}")
+
+        category_ids = [first_category + i for i in range(categories)]
+        user_ids = [first_user + i for i in range(users)]
+        category_rows = {
+            i: {"id": i, "title": f"Категория {i}", "is_locked": False, "updated_at": now, "topic_count": 0,
+                "last_activity_at": None} for i in category_ids
+        }
+        topic_rows = []
+
+        # Время создания тем равномерно распределено по году, комментарии темы равномерно распределены по времени
+        # от создания темы до текущего момента
+        for i, size in enumerate(get_thread_sizes(rng, topics, comments, skew)):
+            created_time = start + timedelta(seconds=rng.uniform(0, 365 * 86400 * 0.9))
+            comment_step = (now - created_time) / (size + 1)
+            last_comment_at = created_time + comment_step * size if size else None
+            hot_score = get_hot_score([created_time] + [created_time + comment_step * k for k in range(1, size + 1)])
+            title = generate_text(rng, 3, 16)
+            text = generate_text(rng, 10, 60, rng.randint(1, 4))
+
+            topic = {
+                "id": first_topic + i, "author_id": rng.choice(user_ids), "category_id": rng.choice(category_ids),
+                "title": title, "text": text, "short_title": shorten_words(title, Topic.SHORT_TITLE_WORDS),
+                "excerpt": shorten_words(text, Topic.EXCERPT_WORDS), "is_pinned": rng.random() < 0.01,
+                "is_locked": False, "created_time": created_time, "updated_at": last_comment_at or created_time,
+                "comment_count": size, "last_comment_at": last_comment_at,
+                "last_activity_at": last_comment_at or created_time, "hot_score": hot_score,
+            }
+            topic_rows.append(topic)
+
+            category = category_rows[topic["category_id"]]
+            category["topic_count"] += 1
+            if category["last_activity_at"] is None or category["last_activity_at"] < topic["updated_at"]:
+                category["last_activity_at"] = topic["updated_at"]
+
+        insert_batches(connection, Category.__table__, category_rows.values(), batch_size)
+        log(f"Категории: {categories}")
+
+        insert_batches(connection, Topic.__table__, topic_rows, batch_size)
+        log(f"Темы: {topics}")
+
+        def generate_comments():
+            comment_id = first_comment
+
+            for topic in topic_rows:
+                size = topic["comment_count"]
+                comment_step = (now - topic["created_time"]) / (size + 1)
+
+                for k in range(1, size + 1):
+                    created_time = topic["created_time"] + comment_step * k
+                    yield {"id": comment_id, "author_id": rng.choice(user_ids), "topic_id": topic["id"],
+                           "text": generate_text(rng, 5, 40, rng.randint(1, 3)), "created_time": created_time,
+                           "updated_at": created_time}
+                    comment_id += 1
+
+        log(f"Комментарии: {insert_batches(connection, Comment.__table__, generate_comments(), batch_size)}")
@@ -1,28 +1,298 @@
+import random
+import sqlite3
+
 import sqlalchemy
-from sqlalchemy import orm
+from sqlalchemy import orm, event, pool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
 
 SqlAlchemyBase = declarative_base()
 __factory = None
+__engine = None
+__read_engines = []
+__change_listeners = []
 
+# Настройки, которые применяются к каждому новому соединению с SQLite. WAL позволяет читать во время записи,
+# synchronous=NORMAL в режиме WAL не теряет целостность базы данных при сбое, cache_size задаётся в КБ
+# (отрицательное значение), busy_timeout - сколько миллисекунд ждать снятия блокировки вместо ошибки
+# "database is locked"
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -65536,
+    "mmap_size": 268435456,
+    "busy_timeout": 5000,
+    "foreign_keys": "ON",
+}
 
-def global_init(database_url: str):
-    """Инициализация подключения к базе данных"""
-    global __factory
+
+class RoutingSession(Session):
+    """
+    Сессия, которая выполняет чтение через реплику или отдельный пул соединений, если сессия помечена через
+    use_read_pool. Реплика выбирается случайно один раз на сессию, чтобы запросы одной страницы видели одно состояние
+    базы данных. Запись и всё чтение после первой записи в сессии выполняются через основную базу данных, чтобы были
+    видны изменения, ещё не сохранённые коммитом
+    """
+
+    def __init__(self, *args, read_binds=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read_binds = read_binds
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.read_binds and self.info.get("read_only") and not self.info.get("has_writes") and \
+                not self._flushing and isinstance(clause, Select):
+            if "read_bind" not in self.info:
+                self.info["read_bind"] = random.choice(self.read_binds)
+
+            return self.info["read_bind"]
+
+        return super().get_bind(mapper, clause, **kwargs)
+
+
+def set_sqlite_pragmas(engine, pragmas: dict):
+    """
+    Применять настройки (PRAGMA) к каждому новому соединению с SQLite
+
+    :arg engine: движок SQLAlchemy
+    :arg pragmas: название настройки -> значение
+    """
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+
+        cursor.close()
+
+
+def global_init(database_url: str, pool_size: int = None, max_overflow: int = None, pool_timeout: int = None,
+                pool_recycle: int = None, pool_pre_ping: bool = False, sqlite_pragmas: dict = None,
+                read_pool_size: int = None, replica_urls: list = None):
+    """
+    Инициализация подключения к базе данных
+
+    :arg database_url: адрес базы данных
+    :arg pool_size: количество постоянно открытых соединений в пуле (None - значение по умолчанию для драйвера)
+    :arg max_overflow: количество соединений, которые можно открыть сверх pool_size при нагрузке
+    :arg pool_timeout: сколько секунд ждать свободное соединение из пула
+    :arg pool_recycle: через сколько секунд пересоздавать соединение
+    :arg pool_pre_ping: проверять соединение перед выдачей из пула
+    :arg sqlite_pragmas: настройки SQLite, которые заменяют или дополняют SQLITE_PRAGMAS
+    :arg read_pool_size: размер отдельного пула соединений для чтения (None или 0 - чтение через основной пул).
+        Если указаны реплики, то это размер пула каждой реплики
+    :arg replica_urls: адреса реплик основной базы данных, через которые страницы читают базу данных вместо
+        отдельного пула
+    """
+    global __factory, __engine, __read_engines
 
     if __factory:
         return
 
-    engine = sqlalchemy.create_engine(database_url, echo=False)
-    __factory = orm.sessionmaker(bind=engine)
+    pool_options = {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_recycle": pool_recycle,
+    }
+    pool_options = {key: value for key, value in pool_options.items() if value is not None}
+
+    # Для файловой SQLite по умолчанию используется пул без хранения соединений, поэтому при явной настройке размера
+    # пула используем обычный пул с очередью
+    is_sqlite = sqlalchemy.engine.make_url(database_url).get_backend_name() == "sqlite"
+    if is_sqlite and {"pool_size", "max_overflow", "pool_timeout"} & pool_options.keys():
+        pool_options["poolclass"] = pool.QueuePool
+
+    __engine = sqlalchemy.create_engine(database_url, echo=False, pool_pre_ping=pool_pre_ping, **pool_options)
+
+    if is_sqlite:
+        pragmas = {**SQLITE_PRAGMAS, **(sqlite_pragmas or {})}
+        set_sqlite_pragmas(__engine, pragmas)
+
+    # Отдельные пулы для страниц, которые только читают базу данных: к репликам или, если их нет, к основной базе
+    # данных. Запросы на чтение не ждут соединения, пока основной пул занят записью. Соединения SQLite этих пулов не
+    # могут изменять базу данных (query_only)
+    read_urls = replica_urls or ([database_url] if read_pool_size else [])
+    __read_engines = []
+
+    for read_url in read_urls:
+        read_pool_options = dict(pool_options)
+        if read_pool_size:
+            read_pool_options.update(pool_size=read_pool_size, poolclass=pool.QueuePool)
+
+        read_engine = sqlalchemy.create_engine(read_url, echo=False, pool_pre_ping=pool_pre_ping, **read_pool_options)
+        if read_engine.url.get_backend_name() == "sqlite":
+            set_sqlite_pragmas(read_engine, {**SQLITE_PRAGMAS, **(sqlite_pragmas or {}), "query_only": "ON"})
+
+        __read_engines.append(read_engine)
+
+    # Сессия привязана к текущему потоку, то есть к обрабатываемому запросу, и удаляется в конце запроса
+    __factory = orm.scoped_session(
+        orm.sessionmaker(bind=__engine, class_=RoutingSession, read_binds=tuple(__read_engines))
+    )
 
     from . import models
 
-    SqlAlchemyBase.metadata.create_all(engine)
+    SqlAlchemyBase.metadata.create_all(__engine)
 
 
 def create_session() -> Session:
-    """Создать сессию с базой данных"""
+    """Получить сессию с базой данных для текущего запроса (потока)"""
     global __factory
     return __factory()
+
+
+def use_read_pool():
+    """
+    Выполнять чтение в сессии текущего запроса (потока) через реплику или пул соединений для чтения, если они
+    настроены. Пометка действует до закрытия сессии
+    """
+    create_session().info["read_only"] = True
+
+
+def has_writes() -> bool:
+    """Проверить, что сессия текущего запроса (потока) изменяла базу данных"""
+    return bool(create_session().info.get("has_writes"))
+
+
+def sync_sqlite_replicas() -> int:
+    """
+    Скопировать основную базу данных SQLite в реплики SQLite резервным копированием sqlite3. Используется вместо
+    настоящей репликации, чтобы проверить работу с репликами на двух файлах SQLite. Возвращает количество
+    обновлённых реплик
+    """
+    global __engine, __read_engines
+    count = 0
+
+    with __engine.connect() as source:
+        for engine in __read_engines:
+            if engine.url.get_backend_name() != "sqlite" or engine.url.database == __engine.url.database:
+                continue
+
+            target = sqlite3.connect(engine.url.database)
+            try:
+                source.connection.dbapi_connection.backup(target)
+            finally:
+                target.close()
+
+            count += 1
+
+    return count
+
+
+def remove_session():
+    """Закрыть сессию текущего запроса (потока) и вернуть соединение в пул"""
+    global __factory
+
+    if __factory:
+        __factory.remove()
+
+
+def dispose_engine():
+    """
+    Забыть соединения пула, не закрывая их. Вызывается в процессе-работнике сервера после fork, чтобы он не
+    использовал соединения, открытые родительским процессом
+    """
+    global __engine, __read_engines
+
+    for engine in (__engine, *__read_engines):
+        if engine is not None:
+            engine.dispose(close=False)
+
+
+def get_engine_pool_status(engine) -> dict:
+    """Получить состояние пула соединений движка"""
+    engine_pool = engine.pool
+    status = {"pool": type(engine_pool).__name__}
+
+    if isinstance(engine_pool, pool.QueuePool):
+        status.update(
+            size=engine_pool.size(),
+            checked_in=engine_pool.checkedin(),
+            checked_out=engine_pool.checkedout(),
+            overflow=engine_pool.overflow(),
+        )
+
+    return status
+
+
+def get_pool_status() -> dict:
+    """Получить состояние пула соединений с базой данных и, если они настроены, пулов для чтения"""
+    global __engine, __read_engines
+    status = get_engine_pool_status(__engine)
+
+    if __read_engines:
+        status["read_pools"] = [get_engine_pool_status(engine) for engine in __read_engines]
+
+    return status
+
+
+def on_change(*targets):
+    """
+    Декоратор для функции, которая будет вызвана после коммита, изменившего объекты указанных моделей
+    (создание, изменение, удаление). Используется для инвалидации кэшей. Вместо модели можно указать её атрибуты:
+    тогда функция вызывается только после создания или удаления объектов модели и изменения этих атрибутов
+
+    :arg targets: модели базы данных или атрибуты моделей, за изменениями которых нужно следить
+    """
+    models = {target for target in targets if isinstance(target, type)}
+    attributes = {(target.class_, target.key) for target in targets if not isinstance(target, type)}
+    # Создание и удаление объектов модели, за атрибутами которой следим
+    attributes.update({(model, None) for model, _ in attributes})
+
+    def decorator(func):
+        __change_listeners.append((models, attributes, func))
+        return func
+
+    return decorator
+
+
+def _collect_changes(session: Session, changes):
+    """
+    Запомнить изменения сессии до коммита
+
+    :arg session: сессия базы данных
+    :arg changes: пары (модель, название изменённого атрибута), для созданных и удалённых объектов - (модель, None)
+    """
+    session.info["has_writes"] = True
+    session.info.setdefault("changes", set()).update(changes)
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    # В after_flush списки объектов и история атрибутов ещё в состоянии до flush
+    changes = {(type(obj), None) for obj in (*session.new, *session.deleted)}
+
+    for obj in session.dirty:
+        changes.update(
+            (type(obj), attribute.key) for attribute in sqlalchemy.inspect(obj).attrs if attribute.history.has_changes()
+        )
+
+    _collect_changes(session, changes)
+
+
+@event.listens_for(Session, "after_bulk_update")
+def _after_bulk_update(update_context):
+    model = update_context.mapper.class_
+    _collect_changes(update_context.session, {(model, getattr(key, "key", key)) for key in update_context.values})
+
+
+@event.listens_for(Session, "after_bulk_delete")
+def _after_bulk_delete(delete_context):
+    _collect_changes(delete_context.session, {(delete_context.mapper.class_, None)})
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    changes = session.info.pop("changes", set())
+    changed_models = {model for model, _ in changes}
+
+    for models, attributes, func in __change_listeners:
+        if models & changed_models or attributes & changes:
+            func()
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("changes", None)
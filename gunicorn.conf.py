@@ -0,0 +1,29 @@
+"""
+Настройки gunicorn. Количество процессов и потоков задаётся переменными окружения WEB_WORKERS и WEB_THREADS, адрес -
+WEB_BIND
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("WEB_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("WEB_THREADS", 4))
+# Приложение загружается один раз в главном процессе (импорт, склонения, поисковый индекс), а работники получают его
+# копию при fork
+preload_app = True
+
+
+def post_fork(server, worker):
+    from database import session as db_session
+
+    # Соединения с базой данных, открытые главным процессом, не должны использоваться работниками
+    db_session.dispose_engine()
+
+
+def post_worker_init(worker):
+    from core import search as forum_search
+
+    # Поисковый индекс в памяти (база данных без FTS5) у каждого работника свой и не видит изменений из других
+    # работников, поэтому с ним сервер запускается только с одним процессом
+    if worker.cfg.workers > 1 and forum_search.is_process_local():
+        raise RuntimeError("The in-memory search index does not support several workers, set WEB_WORKERS=1")
@@ -1,62 +1,167 @@
-import itertools
 import os
 import random
+import sys
 from string import ascii_letters, digits, punctuation
 
+import click
 from dotenv import load_dotenv
-from flask import Flask, redirect, abort, url_for, request
+from flask import Flask, redirect, abort, url_for, request, jsonify, current_app
+from flask.cli import with_appcontext
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
+from sqlalchemy.exc import IntegrityError
 
 from core.forms import *
 from database import session as db_session
 from database.models import *
-from core.utilities import render
+from database.seed import seed, SEED_PASSWORD
+from database.queries import get_front_page, repair_counters, get_forum_stamp, get_topic_stamp, get_category_stamp, \
+    get_cached_user, delete_topic, delete_category, delete_user
+from core.utilities import render, render_stream, Pagination, warm_up_inflections
+from core import search as forum_search
+from core import fragments
+from core.http_cache import init_http_cache, conditional_page
+from core.passwords import init_password_hashing, get_hash_stats
+from core.read_routing import init_read_routing, read_only_view, stick_to_primary
+from core import comment_queue
+from core.instrumentation import init_instrumentation, query_budget, capture_queries, find_full_scans
 
 load_dotenv()  # загрузка переменных
 
-app = Flask("Internet forum")
-app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY")
-app.config["HEAD_ADMIN_PASSWORD"] = os.environ.get("HEAD_ADMIN_PASSWORD")
 
-# Если пароля нет в виртуальном окружении, то пароль будет сгенерирован
-if not app.config["HEAD_ADMIN_PASSWORD"]:
-    app.config["HEAD_ADMIN_PASSWORD"] = "".join(
-        [random.choice(ascii_letters + digits + punctuation) for _ in range(16)]
-    )
+def get_int_env(name: str):
+    """Получить целое число из переменной окружения. Если переменная не задана, то будет возвращён None"""
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def get_float_env(name: str):
+    """Получить дробное число из переменной окружения. Если переменная не задана, то будет возвращён None"""
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+def get_dict_env(name: str):
+    """
+    Получить словарь из переменной окружения вида "ключ=значение;ключ=значение". Если переменная не задана, то будет
+    возвращён None
+    """
+    value = os.environ.get(name)
+
+    if not value:
+        return None
+
+    return dict(item.strip().split("=", 1) for item in value.split(";") if item.strip())
+
+
+def get_config_from_env() -> dict:
+    """Получить параметры приложения из переменных окружения (и файла .env)"""
+    return {
+        "SECRET_KEY": os.environ.get("SECRET_KEY"),
+        "HEAD_ADMIN_PASSWORD": os.environ.get("HEAD_ADMIN_PASSWORD"),
+        "FRAGMENT_CACHE_URL": os.environ.get("FRAGMENT_CACHE_URL"),
+        # Отправлять длинные страницы (например, тему с комментариями) по частям, не дожидаясь окончания рендера
+        "STREAM_PAGES": os.environ.get("STREAM_PAGES", "1") != "0",
+        "COMMENTS_PER_PAGE": int(os.environ.get("COMMENTS_PER_PAGE", 10)),
+        # Подключение к базе данных и пулы соединений (см. database/session.py global_init)
+        "DATABASE_URL": os.environ.get("DATABASE_URL"),
+        "DATABASE_POOL_SIZE": get_int_env("DATABASE_POOL_SIZE"),
+        "DATABASE_MAX_OVERFLOW": get_int_env("DATABASE_MAX_OVERFLOW"),
+        "DATABASE_POOL_TIMEOUT": get_int_env("DATABASE_POOL_TIMEOUT"),
+        "DATABASE_POOL_RECYCLE": get_int_env("DATABASE_POOL_RECYCLE"),
+        "DATABASE_POOL_PRE_PING": os.environ.get("DATABASE_POOL_PRE_PING", "").lower() in ("1", "true", "yes"),
+        "DATABASE_SQLITE_PRAGMAS": get_dict_env("DATABASE_SQLITE_PRAGMAS"),
+        "DATABASE_READ_POOL_SIZE": get_int_env("DATABASE_READ_POOL_SIZE"),
+        "DATABASE_REPLICA_URLS": os.environ.get("DATABASE_REPLICA_URLS", "").split() or None,
+        # Политика хеширования паролей и ограничение одновременных проверок паролей (см. core/passwords.py)
+        "PASSWORD_HASH_ALGORITHM": os.environ.get("PASSWORD_HASH_ALGORITHM"),
+        "PASSWORD_HASH_ITERATIONS": get_int_env("PASSWORD_HASH_ITERATIONS"),
+        "PASSWORD_HASH_THREADS": get_int_env("PASSWORD_HASH_THREADS"),
+        "PASSWORD_HASH_MAX_PENDING": get_int_env("PASSWORD_HASH_MAX_PENDING"),
+        "PASSWORD_HASH_WAIT_TIMEOUT": get_float_env("PASSWORD_HASH_WAIT_TIMEOUT"),
+        # Измерение работы приложения: Server-Timing и /metrics, профилирование медленных запросов
+        # (см. core/instrumentation.py)
+        "METRICS_ENABLED": os.environ.get("METRICS_ENABLED", "").lower() in ("1", "true", "yes"),
+        "PROFILE_SLOW_REQUEST_MS": get_int_env("PROFILE_SLOW_REQUEST_MS"),
+        "PROFILE_DIR": os.environ.get("PROFILE_DIR"),
+        # Сколько секунд после изменения базы данных пользователь читает основную базу данных, а не реплики
+        "DATABASE_STICKY_SECONDS": get_int_env("DATABASE_STICKY_SECONDS") or 10,
+        # Сохранять комментарии через очередь частями в фоновом потоке (см. core/comment_queue.py)
+        "COMMENT_QUEUE_ENABLED": os.environ.get("COMMENT_QUEUE_ENABLED", "").lower() in ("1", "true", "yes"),
+        "COMMENT_QUEUE_WORKERS": get_int_env("COMMENT_QUEUE_WORKERS") or 1,
+        "COMMENT_QUEUE_BATCH_SIZE": get_int_env("COMMENT_QUEUE_BATCH_SIZE") or 100,
+        "COMMENT_QUEUE_FLUSH_MS": get_int_env("COMMENT_QUEUE_FLUSH_MS") or 20,
+    }
+
 
 login_manager = LoginManager()
-login_manager.init_app(app)
+# Страницы и команды, которые create_app добавляет в каждое созданное приложение
+__views = []
+__commands = []
+
+
+def route(rule: str, **options):
+    """Декоратор как app.route, но страница добавляется в приложение при его создании (см. create_app)"""
+    def decorator(func):
+        __views.append((rule, func, options))
+        return func
+
+    return decorator
+
+
+def command(name: str):
+    """Декоратор как app.cli.command, но команда добавляется в приложение при его создании (см. create_app)"""
+    def decorator(func):
+        cli_command = click.command(name)(with_appcontext(func))
+        __commands.append(cli_command)
+        return cli_command
+
+    return decorator
+
+
+def init_database(app: Flask):
+    """Инициализация подключения к базе данных с настройками пула соединений из параметров приложения"""
+    db_session.global_init(
+        app.config["DATABASE_URL"],
+        pool_size=app.config.get("DATABASE_POOL_SIZE"),
+        max_overflow=app.config.get("DATABASE_MAX_OVERFLOW"),
+        pool_timeout=app.config.get("DATABASE_POOL_TIMEOUT"),
+        pool_recycle=app.config.get("DATABASE_POOL_RECYCLE"),
+        pool_pre_ping=app.config.get("DATABASE_POOL_PRE_PING", False),
+        sqlite_pragmas=app.config.get("DATABASE_SQLITE_PRAGMAS"),
+        read_pool_size=app.config.get("DATABASE_READ_POOL_SIZE"),
+        replica_urls=app.config.get("DATABASE_REPLICA_URLS"),
+    )
+
+    db_sess = db_session.create_session()
+    forum_search.init_search(db_sess.get_bind())
+    db_session.remove_session()
+
+
+def close_db_session(exception=None):
+    """Закрыть сессию с базой данных после обработки запроса"""
+    db_session.remove_session()
 
 
 @login_manager.user_loader
 def load_user(user_id):
     db_sess = db_session.create_session()
-    return db_sess.query(User).get(user_id)
+    return get_cached_user(db_sess, int(user_id))
 
 
-@app.route("/")
+@route("/")
+@read_only_view
+@query_budget(11)
+@conditional_page(get_forum_stamp)
 def index():
     """Главная страница форума. Показываются доступные темы"""
     db_sess = db_session.create_session()
-    # Группируем темы по категориям
-    topics = db_sess.query(Topic).all()
-
-    if topics:
-        categories = itertools.groupby(
-            sorted(
-                topics,
-                key=lambda t: ("" if t.category is None else t.category.title, t.is_pinned, t.created_time),
-                reverse=True
-            ),
-            lambda t: t.category
-        )
-    else:
-        categories = None
+    # Первые темы каждой категории и количество тем в них
+    categories = get_front_page(db_sess)
 
     return render("index.html", categories=categories, title="Темы")
 
 
-@app.route("/register", methods=["GET", "POST"])
+@route("/register", methods=["GET", "POST"])
 def register():
     """Страница с формой регистрации на форуме"""
     form = RegistrationForm()
@@ -80,7 +185,7 @@ def register():
         return render("registration.html", title="Регистрация", form=form)
 
 
-@app.route("/login", methods=["GET", "POST"])
+@route("/login", methods=["GET", "POST"])
 def login():
     """Страница с формой входа на форум"""
     form = LoginForm()
@@ -97,6 +202,10 @@ def login():
 
         # Если пользователь существует под этим логином и пароль правильный, то авторизируем его
         if user and user.check_password(form.password.data):
+            # Хеш пароля, созданный по прежней политике, заменяется, пока известен сам пароль
+            if user.rehash_password(form.password.data):
+                db_sess.commit()
+
             login_user(user, remember=True)
             return redirect("/")
         else:
@@ -106,7 +215,7 @@ def login():
         return render(**render_data)
 
 
-@app.route("/logout")
+@route("/logout")
 @login_required
 def logout():
     """Выход из системы"""
@@ -114,23 +223,49 @@ def logout():
     return redirect("/")
 
 
-@app.route("/topic/<int:id>", methods=["GET", "POST"])
+@route("/topic/<int:id>", methods=["GET", "POST"])
+@read_only_view
+@query_budget(10)
+@conditional_page(get_topic_stamp)
 def topic_content(id):
     """Страница с комментариями из определённой темы"""
     form = CommentForm()
 
     db_sess = db_session.create_session()
-    topic = db_sess.query(Topic).get(id)
+    topic = db_sess.query(Topic).options(*get_loader_profile("topic_page")).get(id)
 
     if form.validate_on_submit():
+        submission_key = form.submission_key.data or None
+
+        # Комментарий сохранится позже в фоновом потоке, страница подождёт его сохранения. Повторно отправленная
+        # форма не сохраняется второй раз
+        if comment_queue.is_enabled() and submission_key:
+            comment_queue.enqueue(submission_key, topic.id, current_user.id, form.text.data)
+            stick_to_primary()
+
+            return redirect(url_for("redirect_to_submission", id=topic.id, key=submission_key))
+
         # Добавляем комментарий в базу данных
         comment = Comment(
             author_id=current_user.id,
             topic_id=topic.id,
-            text=form.text.data
+            text=form.text.data,
+            submission_key=submission_key
         )
 
         db_sess.add(comment)
+
+        try:
+            db_sess.flush()
+        except IntegrityError:
+            # Форма уже была отправлена (например, повторное нажатие кнопки), переводим на сохранённый комментарий
+            db_sess.rollback()
+            saved_id = db_sess.query(Comment.id).filter(Comment.submission_key == submission_key).scalar()
+
+            return redirect(url_for("redirect_to_comment", id=saved_id))
+
+        topic.on_comment_added(comment)
+        forum_search.index_comment(db_sess, comment)
         db_sess.commit()
 
         # Переводим на последнию страницу с комментариями и ссылаемся на комментарий, оставленный пользователем
@@ -142,7 +277,9 @@ def topic_content(id):
                 topic.is_pinned = not topic.is_pinned
             elif request.form["button"] == "lock":
                 topic.is_locked = not topic.is_locked
+            topic.touch()
             db_sess.commit()
+            fragments.invalidate_topic(topic.id)
 
             return redirect(url_for("topic_content", id=topic.id))
         else:
@@ -150,16 +287,16 @@ def topic_content(id):
             if topic:
                 # Распределение комментариев по страницам
                 page = request.args.get("page", 1, type=int)
-                pagination_comments = topic.get_comments_pagination()
+                pagination_comments = topic.get_comments_pagination(current_app.config["COMMENTS_PER_PAGE"])
 
-                return render(
+                return (render_stream if current_app.config["STREAM_PAGES"] else render)(
                     "topic.html", title=topic.title, topic=topic, comments=pagination_comments, page=page, form=form
                 )
             else:
                 abort(404, description="Темы с таким ID не существует")
 
 
-@app.route("/create_topic", methods=["GET", "POST"])
+@route("/create_topic", methods=["GET", "POST"])
 @login_required
 def create_topic():
     """Страница с формой создания темы"""
@@ -183,6 +320,12 @@ def create_topic():
             category_id=None if form.category.data == "None" else form.category.data
         )
         db_sess.add(topic)
+        db_sess.flush()
+
+        if topic.category:
+            topic.category.on_topic_added(topic)
+
+        forum_search.index_topic(db_sess, topic)
         db_sess.commit()
 
         return redirect(url_for("topic_content", id=topic.id))
@@ -190,7 +333,7 @@ def create_topic():
         return render("create_topic.html", title="Создать тему", form=form)
 
 
-@app.route("/topic/<int:id>/edit", methods=["GET", "POST"])
+@route("/topic/<int:id>/edit", methods=["GET", "POST"])
 @login_required
 def edit_topic(id):
     """Редактирование темы"""
@@ -216,11 +359,9 @@ def edit_topic(id):
     if form.validate_on_submit():
         # Если была нажата кнопка "Удалить"
         if form.delete.data:
-            for comment in topic.comments:
-                db_sess.delete(comment)
-
-            db_sess.delete(topic)
+            delete_topic(db_sess, topic)
             db_sess.commit()
+            fragments.invalidate_topic(id)
 
             return redirect(url_for("index"))
         # В остальных случаях считаем, что была нажата кнопка "Сохранить"
@@ -232,11 +373,21 @@ def edit_topic(id):
                 return render("edit_topic.html", title="Редактировать тему", form=form,
                               error="Данные формы совпадают с исходными данными")
             else:
+                # При переносе темы в другую категорию обновляем счётчики обеих категорий
+                if str(topic.category_id) != str(form.category.data):
+                    if topic.category:
+                        topic.category.on_topic_removed(topic)
+                    if form.category.data is not None:
+                        db_sess.query(Category).get(form.category.data).on_topic_added(topic)
+
                 topic.title = form.title.data
                 topic.text = form.text.data
                 topic.category_id = form.category.data
                 topic.is_locked = form.locked.data
+                topic.touch()
+                forum_search.index_topic(db_sess, topic)
                 db_sess.commit()
+                fragments.invalidate_topic(id)
 
                 return redirect(url_for("topic_content", id=id))
     else:
@@ -248,7 +399,9 @@ def edit_topic(id):
         return render("edit_topic.html", title="Редактировать тему", form=form)
 
 
-@app.route("/comment/<int:id>")
+@route("/comment/<int:id>")
+@read_only_view
+@query_budget(4)
 def redirect_to_comment(id: int):
     """Перейти к комментарию в теме"""
     db_sess = db_session.create_session()
@@ -259,7 +412,7 @@ def redirect_to_comment(id: int):
     else:
         topic = comment.topic
         # Определяем, на которой странице находится комментарий
-        page = topic.get_comments_pagination().find_page(comment)
+        page = comment.get_page(current_app.config["COMMENTS_PER_PAGE"])
 
         return redirect(url_for(
             "topic_content",
@@ -269,7 +422,29 @@ def redirect_to_comment(id: int):
         ))
 
 
-@app.route("/comment/<int:id>/edit", methods=["GET", "POST"])
+@route("/topic/<int:id>/submitted/<key>")
+@login_required
+def redirect_to_submission(id: int, key: str):
+    """Перейти к комментарию, отправленному через очередь, когда он будет сохранён"""
+    comment_queue.wait(key, current_app.config["COMMENT_QUEUE_WAIT_SECONDS"])
+
+    db_sess = db_session.create_session()
+    comment = db_sess.query(Comment).filter(Comment.submission_key == key).first()
+
+    if comment:
+        return redirect(url_for(
+            "topic_content",
+            id=id,
+            _anchor=f"comment-{comment.id}",
+            page=comment.get_page(current_app.config["COMMENTS_PER_PAGE"])
+        ))
+    else:
+        # Комментарий ещё в очереди, переводим на последнюю страницу темы
+        comment_count = db_sess.query(Topic.comment_count).filter(Topic.id == id).scalar() or 0
+        return redirect(url_for("topic_content", id=id, page=comment_count // current_app.config["COMMENTS_PER_PAGE"] + 1))
+
+
+@route("/comment/<int:id>/edit", methods=["GET", "POST"])
 @login_required
 def edit_comment(id):
     """Редактирование комментария"""
@@ -288,8 +463,13 @@ def edit_comment(id):
     if form.validate_on_submit():
         # Если была нажата кнопка "Удалить"
         if form.delete.data:
+            if comment.topic:
+                comment.topic.on_comment_removed(comment)
+
+            forum_search.remove_comment(db_sess, comment)
             db_sess.delete(comment)
             db_sess.commit()
+            fragments.invalidate_comment(id)
 
             return redirect(url_for("topic_content", id=comment.topic_id))
         # В остальных случаях считаем, что была нажата кнопка "Сохранить"
@@ -299,7 +479,11 @@ def edit_comment(id):
                               error="Данные формы совпадают с исходными данными")
             else:
                 comment.text = form.text.data
+                if comment.topic:
+                    comment.topic.touch()
+                forum_search.index_comment(db_sess, comment)
                 db_sess.commit()
+                fragments.invalidate_comment(id)
 
                 return redirect(url_for("redirect_to_comment", id=comment.id))
     else:
@@ -308,11 +492,19 @@ def edit_comment(id):
         return render("edit_comment.html", title="Редактировать комментарий", form=form)
 
 
-@app.route("/category/<id>")
+@route("/category/<id>")
+@read_only_view
+@query_budget(9)
+@conditional_page(get_category_stamp)
 def category_content(id):
     """Темы в категории"""
     db_sess = db_session.create_session()
     page = request.args.get("page", 1, type=int)
+    # Сортировка тем: новые, по последнему комментарию или популярные (см. TOPIC_SORTS)
+    sort = request.args.get("sort", "new")
+
+    if sort not in TOPIC_SORTS:
+        abort(400)
 
     # Если был вставлен ID, то находим тему в базе данных по этому ID
     if id.isdigit():
@@ -321,23 +513,49 @@ def category_content(id):
         if not category:
             abort(404, description="Категории с таким ID не существует")
 
-        pagination_topics = category.get_topics_pagination()
+        pagination_topics = category.get_topics_pagination(sort=sort)
 
-        return render("category.html", title=category.title, category=category, topics=pagination_topics, page=page)
+        return render(
+            "category.html", title=category.title, category=category, topics=pagination_topics, page=page, sort=sort
+        )
     # Если же был введён no_category, то показываем страницу с темами без категории
     elif id == "no_category":
         # Распределяем темы по страницам
-        pagination_topics = Pagination(sorted(
-            db_sess.query(Topic).filter(Topic.category_id == None).all(), key=lambda t: t.created_time, reverse=True
-        ), 10)
+        pagination_topics = Pagination(
+            db_sess.query(Topic).options(*get_loader_profile("topic_preview")).filter(
+                Topic.category_id == None
+            ).order_by(
+                TOPIC_SORTS[sort].desc(), Topic.id.desc()
+            ),
+            10
+        )
 
-        return render("category.html", title="Без категории", category=None, topics=pagination_topics, page=page)
+        return render(
+            "category.html", title="Без категории", category=None, topics=pagination_topics, page=page, sort=sort
+        )
     else:
         abort(400)
 
 
-@app.route("/categories", methods=["GET", "POST"])
+@route("/search")
+@query_budget(8)
+def search():
+    """Поиск по темам и комментариям"""
+    query = request.args.get("q", "").strip()
+    page = request.args.get("page", 1, type=int)
+
+    if query:
+        db_sess = db_session.create_session()
+        results = forum_search.search(db_sess, query)
+    else:
+        results = None
+
+    return render("search.html", title="Поиск", query=query, results=results, page=page)
+
+
+@route("/categories", methods=["GET", "POST"])
 @login_required
+@query_budget(4)
 def categories_list():
     """Страница со списком всех категорий на форуме"""
     # Проверяем, что автор комментария является текущим пользователем или является администратором
@@ -347,13 +565,13 @@ def categories_list():
     db_sess = db_session.create_session()
     categories = db_sess.query(Category).order_by("title").all()
     # Для показа кол-ва тем без категории
-    no_category_length = len(db_sess.query(Topic).filter(Topic.category == None).all())
+    no_category_length = db_sess.query(Topic).filter(Topic.category_id == None).count()
 
     return render("categories_list.html", categories=categories, no_category_length=no_category_length,
                   title="Категории")
 
 
-@app.route("/category/create", methods=["GET", "POST"])
+@route("/category/create", methods=["GET", "POST"])
 @login_required
 def create_category():
     """Страница с формой создания категории"""
@@ -378,7 +596,7 @@ def create_category():
         return render("create_category.html", title="Создать категорию", form=form)
 
 
-@app.route("/category/<int:id>/edit", methods=["GET", "POST"])
+@route("/category/<int:id>/edit", methods=["GET", "POST"])
 @login_required
 def edit_category(id):
     """Страница с формой редактирования категории"""
@@ -397,8 +615,9 @@ def edit_category(id):
     if form.validate_on_submit():
         # Если была нажата кнопка "Удалить"
         if form.delete.data:
-            db_sess.delete(category)
+            delete_category(db_sess, category)
             db_sess.commit()
+            fragments.invalidate_all()
 
             return redirect(url_for("categories_list"))
         # В остальных случаях считаем, что была нажата кнопка "Сохранить"
@@ -419,7 +638,7 @@ def edit_category(id):
         return render("edit_category.html", title="Редактировать категорию", form=form)
 
 
-@app.route("/users", methods=["GET", "POST"])
+@route("/users", methods=["GET", "POST"])
 @login_required
 def users_list():
     if not current_user.is_admin():
@@ -434,16 +653,30 @@ def users_list():
             user.role = Role.admin if user.role == Role.user else Role.user
         elif request.form["button"].startswith("delete"):
             user = db_sess.query(User).get(int(request.form["button"].split("-")[-1]))
-            db_sess.delete(user)
+            delete_user(db_sess, user)
 
         db_sess.commit()
+        # Удаление пользователя меняет и счётчики ответов в превью тем, где он оставлял комментарии
+        fragments.invalidate_all()
 
         return redirect(url_for("users_list"))
     else:
         return render("users_list.html", title="Пользователи", users=users)
 
 
-@app.route("/edit_profile", methods=["GET", "POST"])
+@route("/pool_status")
+@login_required
+def pool_status():
+    """Состояние пула соединений с базой данных, статистика хеширования паролей и очереди комментариев"""
+    if not current_user.is_admin():
+        abort(403, "У вас нет доступа к состоянию сервера")
+
+    return jsonify(
+        **db_session.get_pool_status(), password_hashing=get_hash_stats(), comment_queue=comment_queue.get_queue_stats()
+    )
+
+
+@route("/edit_profile", methods=["GET", "POST"])
 @login_required
 def edit_profile():
     """Страница для изменения логина и эл. почты пользователем"""
@@ -476,6 +709,8 @@ def edit_profile():
 
         user.email = form.email.data
         db_sess.commit()
+        # Логин показывается в превью тем и комментариях пользователя
+        fragments.invalidate_all()
 
         return redirect(url_for("edit_profile"))
     else:
@@ -485,7 +720,7 @@ def edit_profile():
         return render(**render_params)
 
 
-@app.route("/edit_password", methods=["GET", "POST"])
+@route("/edit_password", methods=["GET", "POST"])
 @login_required
 def edit_password():
     """Страница для изменения пароля от аккаунта пользователем"""
@@ -513,10 +748,9 @@ def edit_password():
         return render(**render_params)
 
 
-def main():
-    db_session.global_init(os.environ.get("DATABASE_URL"))
-
-    # Проверка на то, совпадает ли пароль с паролем заданном в проекте
+@command("bootstrap")
+def bootstrap_command():
+    """Создать главного администратора или обновить его пароль по HEAD_ADMIN_PASSWORD"""
     db_sess = db_session.create_session()
     head_admin_user = db_sess.query(User).filter(User.username == "admin").first()
 
@@ -526,17 +760,170 @@ def main():
             role=Role.admin,
             email="admin@example.com",
         )
-        head_admin_user.set_password(app.config["HEAD_ADMIN_PASSWORD"])
+        head_admin_user.set_password(current_app.config["HEAD_ADMIN_PASSWORD"])
         db_sess.add(head_admin_user)
         db_sess.commit()
 
-    if head_admin_user and not head_admin_user.check_password(app.config["HEAD_ADMIN_PASSWORD"]):
-        head_admin_user.set_password(app.config["HEAD_ADMIN_PASSWORD"])
+    # Проверка на то, совпадает ли пароль с паролем заданном в проекте
+    if not head_admin_user.check_password(current_app.config["HEAD_ADMIN_PASSWORD"]):
+        head_admin_user.set_password(current_app.config["HEAD_ADMIN_PASSWORD"])
         db_sess.commit()
 
-    print(f"Пароль от аккаунта главного администратора: {app.config['HEAD_ADMIN_PASSWORD']}")
+    db_session.remove_session()
+
+    print(f"Пароль от аккаунта главного администратора: {current_app.config['HEAD_ADMIN_PASSWORD']}")
+
+
+@command("seed")
+@click.option("--users", default=1000, help="Количество пользователей")
+@click.option("--categories", default=20, help="Количество категорий")
+@click.option("--topics", default=10000, help="Количество тем")
+@click.option("--comments", default=100000, help="Количество комментариев")
+@click.option("--skew", default=1.1, help="Неравномерность размеров тем (0 - все темы одного размера)")
+@click.option("--skip-search", is_flag=True, help="Не заполнять поисковый индекс")
+def seed_command(users, categories, topics, comments, skew, skip_search):
+    """Заполнить базу данных синтетическими данными для измерения производительности"""
+    db_sess = db_session.create_session()
+    seed(db_sess.get_bind(), users=users, categories=categories, topics=topics, comments=comments, skew=skew)
+
+    if not skip_search:
+        forum_search.reindex(db_sess)
+        db_sess.commit()
+
+    db_session.remove_session()
+
+    print(f"База данных заполнена, пароль пользователей: {SEED_PASSWORD}")
+
 
-    app.run()
+@command("repair-counters")
+def repair_counters_command():
+    """Пересчитать счётчики комментариев и тем и популярность тем по содержимому базы данных"""
+    db_sess = db_session.create_session()
+    repair_counters(db_sess)
+    db_sess.commit()
+
+    print("Счётчики тем и категорий пересчитаны")
+
+
+@command("reindex-search")
+def reindex_search_command():
+    """Заново заполнить поисковый индекс темами и комментариями"""
+    db_sess = db_session.create_session()
+    forum_search.reindex(db_sess)
+    db_sess.commit()
+
+    print("Поисковый индекс заполнен")
+
+
+@command("sync-replicas")
+def sync_replicas_command():
+    """Скопировать основную базу данных SQLite в реплики SQLite из DATABASE_REPLICA_URLS"""
+    print(f"Обновлено реплик: {db_session.sync_sqlite_replicas()}")
+
+
+@command("check-indexes")
+def check_indexes_command():
+    """Проверить через EXPLAIN QUERY PLAN, что запросы страниц для чтения используют индексы (только SQLite)"""
+    db_sess = db_session.create_session()
+    topic = db_sess.query(Topic).first()
+    comment = db_sess.query(Comment).first()
+    category = db_sess.query(Category).first()
+    db_session.remove_session()
+
+    urls = ["/"] + [url_for_path("category_content", id="no_category", sort=sort) for sort in TOPIC_SORTS]
+    if topic:
+        urls += [url_for_path("topic_content", id=topic.id), url_for_path("topic_content", id=topic.id, page=2)]
+    if comment:
+        urls.append(url_for_path("redirect_to_comment", id=comment.id))
+    if category:
+        urls += [url_for_path("category_content", id=category.id, sort=sort) for sort in TOPIC_SORTS]
+
+    # Выполняем запросы страниц и запоминаем все SQL-запросы, которые они сделали. Ответ читается полностью: при
+    # STREAM_PAGES часть запросов (например, комментарии темы) выполняется только во время отправки страницы
+    # Страница с ошибкой не выполнила свои запросы, поэтому её проверка ничего не значит
+    client = current_app.test_client()
+    failed = []
+    with capture_queries() as queries:
+        for url in urls:
+            response = client.get(url)
+            response.get_data()
+
+            if response.status_code >= 400:
+                failed.append(f"{url}: {response.status_code}")
+
+    if failed:
+        print("Страницы вернули ошибку:", *failed, sep="\n")
+        sys.exit(1)
+
+    tables = set(SqlAlchemyBase.metadata.tables)
+    connection = db_session.create_session().connection().connection
+    problems = []
+
+    for statement, parameters in queries:
+        if statement.lstrip().upper().startswith("SELECT"):
+            for full_scan in find_full_scans(connection, statement, parameters, tables):
+                problems.append(f"{full_scan}\n    {' '.join(statement.split())}")
+
+    db_session.remove_session()
+
+    if problems:
+        print("Запросы без индекса:", *problems, sep="\n")
+        sys.exit(1)
+
+    print(f"Все запросы ({len(queries)}) используют индексы")
+
+
+def url_for_path(endpoint: str, **values) -> str:
+    """Получить путь страницы вне обработки запроса"""
+    with current_app.test_request_context():
+        return url_for(endpoint, **values)
+
+
+def create_app(config: dict = None) -> Flask:
+    """
+    Создать приложение: параметры из переменных окружения (их можно заменить через config), страницы, команды
+    и инструменты из core. Затем подключиться к базе данных и заранее загрузить склонения слов. Используется сервером
+    (см. wsgi.py), Flask CLI (FLASK_APP=main) и при запуске сервера для разработки. Подключение к базе данных
+    и поисковый индекс общие для процесса: их настраивает первое созданное приложение
+
+    :arg config: параметры приложения, которые заменяют параметры из переменных окружения
+    """
+    app = Flask("Internet forum")
+    app.config.update(get_config_from_env())
+    app.config.update(config or {})
+
+    # Если пароля нет в виртуальном окружении, то пароль будет сгенерирован
+    if not app.config["HEAD_ADMIN_PASSWORD"]:
+        app.config["HEAD_ADMIN_PASSWORD"] = "".join(
+            [random.choice(ascii_letters + digits + punctuation) for _ in range(16)]
+        )
+
+    login_manager.init_app(app)
+
+    init_instrumentation(app)
+    fragments.init_fragment_cache(app)
+    init_http_cache(app)
+    init_password_hashing(app)
+    init_read_routing(app)
+    comment_queue.init_comment_queue(app)
+
+    app.teardown_appcontext(close_db_session)
+
+    for rule, func, options in __views:
+        app.add_url_rule(rule, view_func=func, **options)
+
+    for cli_command in __commands:
+        app.cli.add_command(cli_command)
+
+    init_database(app)
+    warm_up_inflections()
+
+    return app
+
+
+def main():
+    """Запуск сервера для разработки. Главный администратор создаётся отдельно командой bootstrap"""
+    create_app().run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,40 @@
+"""Добавлены индексы для списков тем и комментариев
+
+Revision ID: 07afd87c05ca
+Revises: bf18ace17b8c
+Create Date: 2026-10-18 13:41:09.226815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '07afd87c05ca'
+down_revision = 'bf18ace17b8c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.create_index('ix_comments_author_id', ['author_id'], unique=False)
+        batch_op.create_index('ix_comments_topic_id_created_time', ['topic_id', 'created_time', 'id'], unique=False)
+
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.create_index('ix_topics_author_id', ['author_id'], unique=False)
+        batch_op.create_index('ix_topics_category_id_created_time', ['category_id', 'created_time', 'id'],
+                              unique=False)
+        batch_op.create_index('ix_topics_category_id_is_pinned_created_time',
+                              ['category_id', 'is_pinned', 'created_time', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.drop_index('ix_topics_category_id_is_pinned_created_time')
+        batch_op.drop_index('ix_topics_category_id_created_time')
+        batch_op.drop_index('ix_topics_author_id')
+
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_index('ix_comments_topic_id_created_time')
+        batch_op.drop_index('ix_comments_author_id')
@@ -0,0 +1,34 @@
+"""Добавлено время изменения категорий
+
+Revision ID: 16d4a1029ab1
+Revises: 947e862810e8
+Create Date: 2026-10-18 17:35:02.664519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '16d4a1029ab1'
+down_revision = '947e862810e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.create_index('ix_topics_updated_at', ['updated_at'], unique=False)
+
+    op.execute("UPDATE categories SET updated_at = last_activity_at")
+
+
+def downgrade():
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.drop_index('ix_topics_updated_at')
+
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
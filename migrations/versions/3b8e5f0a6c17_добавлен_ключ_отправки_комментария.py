@@ -0,0 +1,28 @@
+"""Добавлен ключ отправки комментария
+
+Revision ID: 3b8e5f0a6c17
+Revises: a7d2c4e91b36
+Create Date: 2026-10-18 21:12:40.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8e5f0a6c17'
+down_revision = 'a7d2c4e91b36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('submission_key', sa.String(length=32), nullable=True))
+        batch_op.create_index('ix_comments_submission_key', ['submission_key'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_index('ix_comments_submission_key')
+        batch_op.drop_column('submission_key')
@@ -0,0 +1,26 @@
+"""Добавлен индекс времени изменения категорий
+
+Revision ID: 4f6a2d8c1e93
+Revises: 9d41c7b2e85f
+Create Date: 2026-10-19 10:24:36.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f6a2d8c1e93'
+down_revision = '9d41c7b2e85f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.create_index('ix_categories_updated_at', ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.drop_index('ix_categories_updated_at')
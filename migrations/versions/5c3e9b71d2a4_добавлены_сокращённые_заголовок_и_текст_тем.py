@@ -0,0 +1,54 @@
+"""Добавлены сокращённые заголовок и текст тем
+
+Revision ID: 5c3e9b71d2a4
+Revises: 16d4a1029ab1
+Create Date: 2026-10-18 18:04:21.517309
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c3e9b71d2a4'
+down_revision = '16d4a1029ab1'
+branch_labels = None
+depends_on = None
+
+
+def shorten_words(source, words_limit):
+    # Копия core.utilities.shorten_words на момент миграции
+    if source is None:
+        return None
+
+    words = source.split(maxsplit=words_limit)
+
+    if len(words) > words_limit:
+        return " ".join(words[:words_limit]) + "..."
+    else:
+        return source
+
+
+def upgrade():
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('short_title', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('excerpt', sa.String(), nullable=True))
+
+    # Заполняем сокращения для уже существующих тем
+    connection = op.get_bind()
+    topics = connection.execute(sa.text("SELECT id, title, text FROM topics")).fetchall()
+
+    if topics:
+        connection.execute(
+            sa.text("UPDATE topics SET short_title = :short_title, excerpt = :excerpt WHERE id = :id"),
+            [
+                {"id": i, "short_title": shorten_words(title, 12), "excerpt": shorten_words(text, 16)}
+                for i, title, text in topics
+            ]
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.drop_column('excerpt')
+        batch_op.drop_column('short_title')
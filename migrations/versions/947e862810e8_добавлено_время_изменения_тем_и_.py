@@ -0,0 +1,36 @@
+"""Добавлено время изменения тем и комментариев
+
+Revision ID: 947e862810e8
+Revises: 07afd87c05ca
+Create Date: 2026-10-18 16:12:47.803126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '947e862810e8'
+down_revision = '07afd87c05ca'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    # Для уже существующих записей считаем, что они не изменялись после создания
+    op.execute("UPDATE comments SET updated_at = created_time")
+    op.execute("UPDATE topics SET updated_at = coalesce(last_comment_at, created_time)")
+
+
+def downgrade():
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
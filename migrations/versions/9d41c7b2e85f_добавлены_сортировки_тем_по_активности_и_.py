@@ -0,0 +1,85 @@
+"""Добавлены сортировки тем по активности и популярности
+
+Revision ID: 9d41c7b2e85f
+Revises: 3b8e5f0a6c17
+Create Date: 2026-10-18 22:03:11.846120
+
+"""
+import math
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d41c7b2e85f'
+down_revision = '3b8e5f0a6c17'
+branch_labels = None
+depends_on = None
+
+
+# Копия database.models.get_hot_term и add_hot_term на момент миграции
+HOT_HALF_LIFE = timedelta(hours=12)
+HOT_EPOCH = datetime(2020, 1, 1)
+
+
+def get_hot_term(time):
+    return (time - HOT_EPOCH) / HOT_HALF_LIFE
+
+
+def add_hot_term(score, time):
+    term = get_hot_term(time)
+
+    if score is None:
+        return term
+
+    high, low = max(score, term), min(score, term)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def upgrade():
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_activity_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('hot_score', sa.Float(), nullable=True))
+        batch_op.create_index('ix_topics_category_id_is_pinned_last_activity_at',
+                              ['category_id', 'is_pinned', 'last_activity_at', 'id'], unique=False)
+        batch_op.create_index('ix_topics_category_id_is_pinned_hot_score',
+                              ['category_id', 'is_pinned', 'hot_score', 'id'], unique=False)
+        batch_op.create_index('ix_topics_category_id_last_activity_at',
+                              ['category_id', 'last_activity_at', 'id'], unique=False)
+        batch_op.create_index('ix_topics_category_id_hot_score', ['category_id', 'hot_score', 'id'], unique=False)
+
+    op.execute("UPDATE topics SET last_activity_at = COALESCE(last_comment_at, created_time)")
+
+    # Популярность существующих тем считается по времени создания темы и всех её комментариев
+    connection = op.get_bind()
+    topics = connection.execute(
+        sa.text("SELECT id, created_time FROM topics WHERE created_time IS NOT NULL")
+        .columns(id=sa.Integer, created_time=sa.DateTime)
+    )
+    scores = {topic_id: get_hot_term(created_time) for topic_id, created_time in topics}
+    comments = connection.execute(
+        sa.text("SELECT topic_id, created_time FROM comments WHERE created_time IS NOT NULL")
+        .columns(topic_id=sa.Integer, created_time=sa.DateTime)
+    )
+
+    for topic_id, created_time in comments:
+        if topic_id in scores:
+            scores[topic_id] = add_hot_term(scores[topic_id], created_time)
+
+    if scores:
+        connection.execute(
+            sa.text("UPDATE topics SET hot_score = :score WHERE id = :id"),
+            [{"id": topic_id, "score": score} for topic_id, score in scores.items()]
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.drop_index('ix_topics_category_id_hot_score')
+        batch_op.drop_index('ix_topics_category_id_last_activity_at')
+        batch_op.drop_index('ix_topics_category_id_is_pinned_hot_score')
+        batch_op.drop_index('ix_topics_category_id_is_pinned_last_activity_at')
+        batch_op.drop_column('hot_score')
+        batch_op.drop_column('last_activity_at')
@@ -0,0 +1,62 @@
+"""Каскадное удаление тем и комментариев
+
+Revision ID: a7d2c4e91b36
+Revises: 5c3e9b71d2a4
+Create Date: 2026-10-18 19:37:52.204618
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d2c4e91b36'
+down_revision = '5c3e9b71d2a4'
+branch_labels = None
+depends_on = None
+
+# Внешние ключи были созданы без имени, поэтому для их удаления в batch-режиме им даются имена по шаблону
+naming_convention = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+
+
+def upgrade():
+    # Строки, ссылающиеся на уже удалённые записи: темы и комментарии удалённых пользователей остаются без автора,
+    # темы удалённых категорий переносятся в "Без категории", комментарии удалённых тем удаляются
+    op.execute("UPDATE topics SET author_id = NULL WHERE author_id NOT IN (SELECT id FROM users)")
+    op.execute("UPDATE topics SET category_id = NULL WHERE category_id NOT IN (SELECT id FROM categories)")
+    op.execute("UPDATE comments SET author_id = NULL WHERE author_id NOT IN (SELECT id FROM users)")
+    op.execute("DELETE FROM comments WHERE topic_id IS NULL OR topic_id NOT IN (SELECT id FROM topics)")
+
+    with op.batch_alter_table('topics', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('fk_topics_author_id_users', type_='foreignkey')
+        batch_op.drop_constraint('fk_topics_category_id_categories', type_='foreignkey')
+        batch_op.create_foreign_key(
+            'fk_topics_author_id_users', 'users', ['author_id'], ['id'], ondelete='CASCADE'
+        )
+        batch_op.create_foreign_key(
+            'fk_topics_category_id_categories', 'categories', ['category_id'], ['id'], ondelete='CASCADE'
+        )
+
+    with op.batch_alter_table('comments', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('fk_comments_author_id_users', type_='foreignkey')
+        batch_op.drop_constraint('fk_comments_topic_id_topics', type_='foreignkey')
+        batch_op.create_foreign_key(
+            'fk_comments_author_id_users', 'users', ['author_id'], ['id'], ondelete='CASCADE'
+        )
+        batch_op.create_foreign_key(
+            'fk_comments_topic_id_topics', 'topics', ['topic_id'], ['id'], ondelete='CASCADE'
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('comments', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('fk_comments_topic_id_topics', type_='foreignkey')
+        batch_op.drop_constraint('fk_comments_author_id_users', type_='foreignkey')
+        batch_op.create_foreign_key('fk_comments_topic_id_topics', 'topics', ['topic_id'], ['id'])
+        batch_op.create_foreign_key('fk_comments_author_id_users', 'users', ['author_id'], ['id'])
+
+    with op.batch_alter_table('topics', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('fk_topics_category_id_categories', type_='foreignkey')
+        batch_op.drop_constraint('fk_topics_author_id_users', type_='foreignkey')
+        batch_op.create_foreign_key('fk_topics_category_id_categories', 'categories', ['category_id'], ['id'])
+        batch_op.create_foreign_key('fk_topics_author_id_users', 'users', ['author_id'], ['id'])
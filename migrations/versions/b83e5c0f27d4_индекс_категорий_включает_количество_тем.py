@@ -0,0 +1,28 @@
+"""Индекс категорий включает количество тем
+
+Revision ID: b83e5c0f27d4
+Revises: 4f6a2d8c1e93
+Create Date: 2026-10-20 14:07:12.301846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b83e5c0f27d4'
+down_revision = '4f6a2d8c1e93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.drop_index('ix_categories_updated_at')
+        batch_op.create_index('ix_categories_updated_at_topic_count', ['updated_at', 'topic_count'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.drop_index('ix_categories_updated_at_topic_count')
+        batch_op.create_index('ix_categories_updated_at', ['updated_at'], unique=False)
@@ -0,0 +1,49 @@
+"""Добавлены счётчики комментариев и тем
+
+Revision ID: bf18ace17b8c
+Revises: cd1342431b77
+Create Date: 2026-10-18 12:04:31.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bf18ace17b8c'
+down_revision = 'cd1342431b77'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('topic_count', sa.Integer(), nullable=False, server_default="0"))
+        batch_op.add_column(sa.Column('last_activity_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), nullable=False, server_default="0"))
+        batch_op.add_column(sa.Column('last_comment_at', sa.DateTime(), nullable=True))
+
+    # Заполняем счётчики по уже существующим темам и комментариям
+    op.execute(
+        "UPDATE topics SET "
+        "comment_count = (SELECT count(comments.id) FROM comments WHERE comments.topic_id = topics.id), "
+        "last_comment_at = (SELECT max(comments.created_time) FROM comments WHERE comments.topic_id = topics.id)"
+    )
+    op.execute(
+        "UPDATE categories SET "
+        "topic_count = (SELECT count(topics.id) FROM topics WHERE topics.category_id = categories.id), "
+        "last_activity_at = (SELECT max(coalesce(topics.last_comment_at, topics.created_time)) FROM topics "
+        "WHERE topics.category_id = categories.id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.drop_column('last_comment_at')
+        batch_op.drop_column('comment_count')
+
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.drop_column('last_activity_at')
+        batch_op.drop_column('topic_count')
@@ -0,0 +1,160 @@
+"""
+Проверка лимитов запросов к базе данных (core.instrumentation.query_budget). Каждая страница с лимитом, включая
+отправку форм, запрашивается на копии database/example.db в режиме тестирования, где превышение лимита
+выбрасывает QueryBudgetExceeded
+
+Запуск: python -m pytest
+"""
+import os
+import shutil
+import uuid
+
+import pytest
+
+EXAMPLE_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "example.db")
+PASSWORD = "budget_password"
+# Страницы с лимитом запросов, которые проверяются ниже
+BUDGETED_ENDPOINTS = {
+    "index", "topic_content", "redirect_to_comment", "category_content", "search", "categories_list"
+}
+
+
+@pytest.fixture(scope="module")
+def forum(tmp_path_factory):
+    """Приложение в режиме тестирования на копии example.db с пользователем, администратором и их темой"""
+    path = tmp_path_factory.mktemp("database") / "forum.db"
+    shutil.copy(EXAMPLE_DB, path)
+
+    import main
+    from core import comment_queue
+    from database import session as db_session
+    from database.models import User, Role, Topic, Category, Comment
+
+    app = main.create_app({
+        "TESTING": True, "WTF_CSRF_ENABLED": False, "DATABASE_URL": f"sqlite:///{path}?check_same_thread=False"
+    })
+
+    db_sess = db_session.create_session()
+    users = {}
+
+    for username, role in (("budget_user", Role.user), ("budget_admin", Role.admin)):
+        user = User(username=username, email=f"{username}@example.com", role=role)
+        user.set_password(PASSWORD)
+        db_sess.add(user)
+        users[username] = user
+
+    # Тема пользователя в категории: автор темы загружается профилем topic_page не полностью
+    category = db_sess.query(Category).first()
+    topic = Topic(author=users["budget_user"], title="Тема для проверки", text="Текст темы", category=category)
+    db_sess.add(topic)
+    db_sess.flush()
+    category.on_topic_added(topic)
+    db_sess.commit()
+
+    busy_topic_id = db_sess.query(Topic.id).order_by(Topic.comment_count.desc()).limit(1).scalar()
+    app.config["TEST_IDS"] = {
+        "topic": topic.id,
+        "busy_topic": busy_topic_id,
+        "category": category.id,
+        "comment": db_sess.query(Comment.id).filter(Comment.topic_id == busy_topic_id).limit(1).scalar(),
+    }
+    db_session.remove_session()
+
+    yield app
+
+    comment_queue.stop()
+
+
+def log_in(app, username: str):
+    """Получить тестовый клиент, авторизованный под пользователем"""
+    client = app.test_client()
+    assert client.post("/login", data={"username": username, "password": PASSWORD}).status_code == 302
+
+    return client
+
+
+def get_page_urls(ids: dict) -> list:
+    """Страницы для чтения с лимитом запросов"""
+    from database.models import TOPIC_SORTS
+
+    return [
+        "/",
+        f"/topic/{ids['topic']}",
+        f"/topic/{ids['busy_topic']}",
+        f"/topic/{ids['busy_topic']}?page=2",
+        f"/comment/{ids['comment']}",
+        "/search?q=тема",
+    ] + [f"/category/{ids['category']}?sort={sort}" for sort in TOPIC_SORTS] + \
+        [f"/category/no_category?sort={sort}" for sort in TOPIC_SORTS]
+
+
+def test_every_budgeted_view_is_checked(forum):
+    budgeted = {endpoint for endpoint, view in forum.view_functions.items() if hasattr(view, "query_budget")}
+
+    assert budgeted == BUDGETED_ENDPOINTS
+
+
+@pytest.mark.parametrize("username", [None, "budget_user"])
+def test_pages(forum, username):
+    client = log_in(forum, username) if username else forum.test_client()
+
+    for url in get_page_urls(forum.config["TEST_IDS"]):
+        # Потоковая страница проверяет лимит после того, как отправлена целиком
+        response = client.get(url)
+        response.get_data()
+
+        assert response.status_code in (200, 302), url
+
+
+def test_categories_list(forum):
+    assert log_in(forum, "budget_admin").get("/categories").status_code == 200
+
+
+def test_post_comment_by_topic_author(forum):
+    from database.queries import user_cache
+
+    client = log_in(forum, "budget_user")
+    # Пользователя нет в кэше, а автор темы уже загружен в сессию не полностью
+    user_cache.clear()
+    response = client.post(f"/topic/{forum.config['TEST_IDS']['topic']}", data={
+        "text": "Комментарий автора темы", "submission_key": uuid.uuid4().hex
+    })
+
+    assert response.status_code == 302
+
+
+def test_post_comment_twice(forum):
+    client = log_in(forum, "budget_user")
+    url = f"/topic/{forum.config['TEST_IDS']['busy_topic']}"
+    data = {"text": "Повторно отправленный комментарий", "submission_key": uuid.uuid4().hex}
+
+    first = client.post(url, data=data)
+    second = client.post(url, data=data)
+
+    assert first.status_code == second.status_code == 302
+    assert first.location == second.location
+
+
+def test_post_queued_comment(forum):
+    from core import comment_queue
+
+    client = log_in(forum, "budget_user")
+    forum.config["COMMENT_QUEUE_ENABLED"] = True
+
+    try:
+        response = client.post(f"/topic/{forum.config['TEST_IDS']['topic']}", data={
+            "text": "Комментарий через очередь", "submission_key": uuid.uuid4().hex
+        })
+    finally:
+        forum.config["COMMENT_QUEUE_ENABLED"] = False
+
+    assert response.status_code == 302
+    assert comment_queue.wait(response.location.rsplit("/", 1)[-1], 5)
+
+
+@pytest.mark.parametrize("button", ["pin", "lock"])
+def test_post_topic_buttons(forum, button):
+    client = log_in(forum, "budget_admin")
+    response = client.post(f"/topic/{forum.config['TEST_IDS']['topic']}", data={"button": button})
+
+    assert response.status_code == 302
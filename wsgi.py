@@ -0,0 +1,6 @@
+"""
+Точка входа для WSGI-сервера. Пример запуска: gunicorn wsgi:app (настройки сервера - в gunicorn.conf.py)
+"""
+from main import create_app
+
+app = create_app()